@@ -0,0 +1,96 @@
+"""
+Pathological inputs for the patterns in rinter_utilities.
+
+Each input is built at several sizes, doubling each time, and every
+parser is timed on it.  When a parser scales linearly, doubling the input
+roughly doubles the time; a ratio near four means it is quadratic.
+
+Usage:
+    python bench_pathological.py [--size N] [--steps N] [--max-ratio R]
+
+Exits with a non-zero status if any ratio exceeds --max-ratio.
+"""
+import argparse
+import sys
+import time
+
+from rinter.rinter import error_list
+from rinter.rinter_utilities import (block_tree, function_headers,
+                                     indentation_levels,
+                                     macro_definitions, parse_fors, parse_ifs,
+                                     parse_lines,
+                                     parse_structs,
+                                     parse_variable_declarations, tokenize,
+                                     variable_declarations)
+
+# Each input repeats a unit which makes a pattern scan far ahead and then
+# fail, without ever giving it the character which would end the scan.
+INPUTS = {
+    'declaration words': 'int a b c d e f g h i j k l m n o p\n',
+    'declaration expression': 'int a = b + c - d * e / f % g | h & i\n',
+    'unterminated ifs': 'if (a) b = c\n',
+    'unclosed parens': 'int f(int a, int b\n',
+    'unclosed structs': 'struct a { int b\n',
+    'unterminated comments': '/* comment\n',
+    'unclosed blocks': 'int f()\n{\n   if (a)\n      for (;;) {\n   int b, a;\n',
+    'unterminated defines': '#define a b c d e f g h i j k l m n o p\n',
+    # A single word as long as the whole input.
+    'long word': 'abcdefghij',
+    }
+
+PARSERS = {
+    'error_list': error_list,
+    'tokenize': tokenize,
+    'parse_variable_declarations': parse_variable_declarations,
+    'parse_ifs': parse_ifs,
+    'parse_structs': parse_structs,
+    'parse_fors': parse_fors,
+    'block_tree': block_tree,
+    'indentation_levels': lambda p: indentation_levels(tokenize(p)),
+    'variable_declarations': lambda p: variable_declarations(
+        tokenize(p), function_headers(tokenize(p))),
+    'macro_definitions': lambda p: macro_definitions(tokenize(p)),
+    'prototypes': lambda p: parse_lines(p).prototypes,
+    }
+
+
+def best_time(function, program, repeat=3):
+    """ Return the fastest of repeat runs of function(program). """
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        function(program)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--size', type=int, default=500,
+                        help='Repetitions of each unit at the smallest size')
+    parser.add_argument('--steps', type=int, default=4,
+                        help='Number of times the size is doubled')
+    parser.add_argument('--max-ratio', type=float, default=3.0,
+                        help='Largest acceptable time ratio per doubling')
+    args = parser.parse_args()
+
+    worst = 0.0
+    for iname, unit in sorted(INPUTS.items()):
+        for pname, function in sorted(PARSERS.items()):
+            times = list()
+            for step in range(args.steps + 1):
+                program = unit * (args.size * 2 ** step)
+                times.append(best_time(function, program))
+            # The mean ratio per doubling, which is steadier than any one.
+            ratio = (times[-1] / max(times[0], 1e-6)) ** (1.0 / args.steps)
+            worst = max(worst, ratio)
+            print('{:<24} {:<28} {:>9.4f}s  x{:.2f}'.format(
+                iname, pname, times[-1], ratio))
+    print('worst ratio per doubling: x{:.2f}'.format(worst))
+    return 1 if worst > args.max_ratio else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
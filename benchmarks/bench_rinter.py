@@ -0,0 +1,134 @@
+"""
+Benchmark of every check in rinter over synthetic programs.
+
+Programs are generated at several sizes along each dimension of the
+generator (function count, function length, comment density and nesting
+depth), every check is timed on each, and the results are written as
+JSON so that two revisions can be compared.
+
+Usage:
+    python bench_rinter.py [--output FILE] [--compare FILE] [--quick]
+
+With --compare, each timing is shown next to the one in FILE, and the
+exit status is non-zero if any is slower by more than --threshold.
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+from rinter import rinter
+from generator import generate_program
+
+CHECKS = list(rinter.RULES) + ['error_list']
+BASE = dict(functions=20, length=20, comment_density=0.1, depth=2)
+SCALES = dict(
+    functions=[20, 80, 320],
+    length=[20, 80, 320],
+    comment_density=[0.0, 0.3, 0.9],
+    depth=[0, 3, 6],
+    )
+
+
+def configurations(quick=False):
+    """ Return a list of (name, generator arguments), varying one
+        dimension of BASE at a time. """
+    ret = list()
+    for dimension, values in sorted(SCALES.items()):
+        for value in values[:2] if quick else values:
+            kwargs = dict(BASE)
+            kwargs[dimension] = value
+            ret.append(('{}={}'.format(dimension, value), kwargs))
+    return ret
+
+
+def best_time(function, program, repeat):
+    """ Return the fastest of repeat runs of function(program). """
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        function(program)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def revision():
+    """ Return the git revision being benchmarked, if there is one. """
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(quick=False, repeat=3):
+    """ Return the benchmark results as a JSON-serializable dict. """
+    results = dict()
+    for name, kwargs in configurations(quick):
+        program = generate_program(**kwargs)
+        timings = dict(size=len(program))
+        for check in CHECKS:
+            timings[check] = best_time(getattr(rinter, check), program, repeat)
+        results[name] = timings
+    return dict(revision=revision(), results=results)
+
+
+def compare(current, previous, threshold):
+    """ Print current next to previous.  Return the number of timings
+        which are more than threshold times slower. """
+    regressions = 0
+    print('{:<22} {:<28} {:>10} {:>10} {:>7}'.format(
+        'configuration', 'check', 'before', 'after', 'ratio'))
+    for name, timings in sorted(current['results'].items()):
+        before = previous['results'].get(name, {})
+        for check in CHECKS:
+            if check not in before:
+                continue
+            ratio = timings[check] / max(before[check], 1e-9)
+            flag = ''
+            if ratio > threshold:
+                regressions += 1
+                flag = ' !'
+            print('{:<22} {:<28} {:>9.4f}s {:>9.4f}s {:>6.2f}x{}'.format(
+                name, check, before[check], timings[check], ratio, flag))
+    return regressions
+
+
+def report(current):
+    """ Print the timings of current, one row per configuration. """
+    print('{:<22} {:>8} '.format('configuration', 'size') +
+          ' '.join('{:>9}'.format(c[:9]) for c in CHECKS))
+    for name, timings in sorted(current['results'].items()):
+        print('{:<22} {:>8} '.format(name, timings['size']) +
+              ' '.join('{:>9.4f}'.format(timings[c]) for c in CHECKS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--output', help='File to save the results to')
+    parser.add_argument('--compare', help='Results of an earlier revision')
+    parser.add_argument('--threshold', type=float, default=1.5,
+                        help='Slowdown which counts as a regression')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--quick', action='store_true',
+                        help='Only run the two smallest sizes of each scale')
+    args = parser.parse_args()
+
+    current = run(args.quick, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as fout:
+            json.dump(current, fout, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare, 'r') as fin:
+            previous = json.load(fin)
+        return 1 if compare(current, previous, args.threshold) else 0
+    report(current)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
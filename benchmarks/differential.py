@@ -0,0 +1,152 @@
+"""
+Differential fuzzing of rinter against an alternative implementation.
+
+Random inputs are made by mutating the test programs and synthetic
+programs from the generator.  Each one is linted by a reference, by
+default the current error_list, and by a candidate implementation, by
+default incremental linting; both are given as module:function and
+called the same way as error_list.  Any difference in the diagnostics (in
+any order) is reported.  The throughput of both is recorded, so a change
+can be shown to be both faster and equivalent.
+
+A reference module may name the rules it checks in REFERENCE_RULES, which
+the candidate is then limited to, and give a normalize function which
+both sides' errors are passed through before they are compared.  With
+--reference regex_reference:error_list the candidate is compared with a
+frozen copy of the original regex linter.
+
+Usage:
+    python differential.py [--candidate MODULE:FUNCTION]
+                           [--reference MODULE:FUNCTION] [--count N]
+                           [--seed N] [--save DIR]
+
+Exits with a non-zero status if any input is linted differently.
+"""
+import argparse
+import collections
+import importlib
+import os
+import random
+import sys
+import time
+
+from generator import generate_program
+from rinter.rinter_utilities import load_file
+
+TESTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                     'tests')
+SEEDS = ['test_good_program.c', 'test_bad_program.c']
+DEFAULT_CANDIDATE = 'rinter.rinter_incremental:incremental_error_list'
+DEFAULT_REFERENCE = 'rinter.rinter:error_list'
+
+# Fragments inserted by mutations: the characters and constructs on which
+# the parsers make their decisions.
+FRAGMENTS = [
+    '{', '}', '(', ')', ';', '\n', '\n\n\n', ' ', '   ', '\t', '"', "'",
+    '/*', '*/', '/* comment */', '// comment\n', '#define Name 1\n',
+    'int f(int a)\n{\n', 'int g(void);\n', 'if (a)\n', 'else\n',
+    'for (;;)\n', 'struct s {\n', 'int b, a;\n', 'x' * 90,
+    ]
+
+
+def load_function(name):
+    """ Return the module and the function named by 'module:function'. """
+    module, _, function = name.partition(':')
+    module = importlib.import_module(module)
+    return module, getattr(module, function)
+
+
+def mutate(program, rng):
+    """ Return program with a few random deletions, insertions and
+        duplications. """
+    for i in range(rng.randint(1, 5)):
+        at = rng.randrange(len(program) + 1)
+        op = rng.random()
+        if op < 0.3:
+            program = program[:at] + program[at + rng.randint(1, 20):]
+        elif op < 0.8:
+            program = program[:at] + rng.choice(FRAGMENTS) + program[at:]
+        else:
+            program = program[:at] + program[at:at + 200] + program[at:]
+    return program
+
+
+def inputs(count, seed):
+    """ Return a generator of count inputs: the seed programs and
+        synthetic programs, each mutated, and now and then left whole. """
+    rng = random.Random(seed)
+    seeds = [load_file(os.path.join(TESTS, name)) for name in SEEDS]
+    for n in range(count):
+        if rng.random() < 0.5:
+            program = rng.choice(seeds)
+        else:
+            program = generate_program(functions=rng.randint(1, 8),
+                                       length=rng.randint(1, 30),
+                                       comment_density=rng.random() * 0.3,
+                                       depth=rng.randint(0, 3), seed=n)
+        yield program if rng.random() < 0.1 else mutate(program, rng)
+
+
+def timed(function, program, rules, totals, name):
+    """ Return the list of errors function(program, rules) finds, adding
+        the time it took to totals.  The errors are collected while timed,
+        since function may return a generator. """
+    start = time.perf_counter()
+    result = list(function(program, rules))
+    totals[name] += time.perf_counter() - start
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--candidate', default=DEFAULT_CANDIDATE,
+                        help='Implementation to compare with the reference, '
+                             'as module:function (default: {})'.format(
+                                 DEFAULT_CANDIDATE))
+    parser.add_argument('--reference', default=DEFAULT_REFERENCE,
+                        help='Implementation to compare with, as '
+                             'module:function (default: {})'.format(
+                                 DEFAULT_REFERENCE))
+    parser.add_argument('--count', type=int, default=1000,
+                        help='Number of inputs')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the random inputs')
+    parser.add_argument('--save', default=None,
+                        help='Directory to write the inputs which differ to')
+    args = parser.parse_args()
+
+    _, candidate = load_function(args.candidate)
+    module, reference = load_function(args.reference)
+    rules = getattr(module, 'REFERENCE_RULES', None)
+    normalize = getattr(module, 'normalize', lambda error: error)
+    totals = collections.Counter()
+    chars = differences = 0
+    for n, program in enumerate(inputs(args.count, args.seed)):
+        chars += len(program)
+        expected = timed(reference, program, rules, totals, 'reference')
+        got = timed(candidate, program, rules, totals, 'candidate')
+        expected = [normalize(e) for e in expected]
+        got = [normalize(e) for e in got]
+        if collections.Counter(expected) == collections.Counter(got):
+            continue
+        differences += 1
+        print('input {} differs:'.format(n))
+        for error in sorted(set(expected) - set(got)):
+            print('  only in reference: {}'.format(error))
+        for error in sorted(set(got) - set(expected)):
+            print('  only in candidate: {}'.format(error))
+        if args.save:
+            os.makedirs(args.save, exist_ok=True)
+            with open(os.path.join(args.save, '{}.c'.format(n)), 'w') as f:
+                f.write(program)
+
+    print('{} inputs, {} characters, {} differ'.format(args.count, chars,
+                                                      differences))
+    for name in ('reference', 'candidate'):
+        print('{:<12} {:8.3f}s {:10.0f} chars/s'.format(
+            name, totals[name], chars / totals[name] if totals[name] else 0))
+    return 1 if differences else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""
+Generator of synthetic CPS360-style C programs.
+
+The programs follow the house style (header, documented functions, two
+blank lines between functions, three space indentation), and their size
+is controlled by the number of functions, the number of statements in
+each function, the density of comments and the depth to which blocks
+are nested.
+"""
+import random
+
+HEADER = """/*
+   Name: A Generated Student
+   Section: 00000001
+   Assignment: {seed}
+   Due: January 1, 2000
+   Credit: 10 points.
+
+   Problem: A generated program with {functions} functions.
+   Solution: Generated.
+   Errors handled: None.
+   Limitations: None.
+*/
+
+#include <stdio.h>
+#include <stdlib.h>
+
+#define LIMIT 100
+
+"""
+BLOCKS = [
+    'if ({a} < {b})',
+    'while ({a} > {b})',
+    'for ({a} = 0; {a} < {b}; {a}++)',
+    ]
+STATEMENTS = [
+    '{a} = {a} + {b};',
+    '{a} = compute_{n}({b});',
+    'printf("%d {{}}\\n", {a});',
+    '{a} = ({a} * {b}) % LIMIT;',
+    ]
+INDENT = '   '
+
+
+def _statements(rng, count, depth, indent, comment_density, functions):
+    """ Return a list of count lines of statements, with blocks nested up
+        to depth levels deep. """
+    lines = list()
+    while len(lines) < count:
+        names = dict(a=rng.choice('ijk'), b=rng.choice(['j', 'k', 'LIMIT']),
+                     n=rng.randrange(functions))
+        if rng.random() < comment_density:
+            lines.append(indent + '/* A comment about the next line. */')
+        if depth > 0 and rng.random() < 0.3:
+            lines.append(indent + rng.choice(BLOCKS).format(**names))
+            lines.append(indent + '{')
+            inner = max(1, (count - len(lines)) // 3)
+            lines.extend(_statements(rng, inner, depth - 1, indent + INDENT,
+                                     comment_density, functions))
+            lines.append(indent + '}')
+        else:
+            lines.append(indent + rng.choice(STATEMENTS).format(**names))
+    return lines
+
+
+def generate_program(functions=10, length=10, comment_density=0.1, depth=2,
+                     seed=0):
+    """ Return the text of a program with the given number of functions,
+        each roughly length statements long.  comment_density is the
+        chance that a statement is preceded by a comment, and depth is
+        how deeply blocks may be nested. """
+    rng = random.Random(seed)
+    parts = [HEADER.format(seed=seed, functions=functions)]
+    for n in range(functions):
+        body = ['   int i;', '   int j = {};'.format(n), '   int k = 0;', '']
+        body.extend(_statements(rng, length, depth, INDENT, comment_density,
+                                functions))
+        body.append('   return i;')
+        parts.append('\n/* Compute the {}th value from x. */\n'.format(n))
+        parts.append('int compute_{}(int x)\n{{\n'.format(n))
+        parts.append('\n'.join(body))
+        parts.append('\n}\n\n')
+    parts.append('\n/* Run every computation. */\nint main(void)\n{\n')
+    parts.append('   return compute_0(0);\n}\n')
+    return ''.join(parts)
@@ -0,0 +1,325 @@
+"""
+A frozen copy of the regex linter rinter started from, to compare the
+rewritten rules with in differential.py.
+
+The patterns and checks below are copied unchanged from the original
+rinter.py and rinter_utilities.py, except that the one message which had
+no location (a missing function comment) now ends with the offset of the
+function.  The original messages end with an offset instead of starting
+with a line and column, and several rules report a different column
+within the same line, so normalize reduces the errors of both linters to
+'line: message'.  Only the rules the original had are compared.
+
+Usage:
+    python differential.py --reference regex_reference:error_list
+"""
+import re
+
+from rinter.rinter_utilities import LineIndex
+
+# The rules of the current linter which the original also had.
+REFERENCE_RULES = [
+    'file_header', 'comment_before_function', 'all_lines_eighty_characters',
+    'no_global_functions', 'two_lines_before_functions',
+    'comments_within_functions', 'functions_twenty_five_lines',
+    ]
+ENDS_WITH_OFFSET = re.compile(r'^(.*) (\d+)$')
+LOCATED = re.compile(r'^(\d+):\d+: (.*)$')
+
+BLOCK = '\{[^\}]*\}'
+PAREN = '\([^\)]*\)'
+COMMENT = re.compile('\/\*+[\s\S]*?\*\/')
+INLINE_COMMENT = re.compile('\/\/[^\n]*')
+FUNCTION_START = re.compile('\w+\s+\w+' + PAREN + '\s*\{')
+FUNCTION_PROTOTYPE = re.compile('\w+\s+\w+' + PAREN + ';')
+WHITESPACE = re.compile('\s?')
+
+REQUIRED_HEADER_SECTIONS = [
+    'Name',
+    'Section',
+    'Assignment',
+    'Due',
+    'Credit',
+    'Problem',
+    'Solution',
+    'Errors handled',
+    'Limitations'
+    ]
+
+
+class Custom_SRE_Match(object):
+
+    def __init__(self, g=None, s=None):
+        self.g = g
+        self.s = s
+
+    def group(self):
+        return self.g
+
+    def span(self):
+        return self.s
+
+
+def find_function_or_comment(line):
+    """ Find instances of either comments and functions or just functions.
+        Returns SRE_Match objects """
+    pos_func_comments = re.compile('{}{}'.format(COMMENT.pattern,
+                                                 WHITESPACE.pattern))
+    pos_funcs = [a  for a in re.finditer(FUNCTION_START, line)]
+    pos_comms = [a for a in re.finditer(pos_func_comments, line)]
+    for i in range(len(pos_funcs)):
+        pos_funcs[i] = glue_backward(pos_funcs[i], pos_comms)
+    return pos_funcs
+
+def glue_backward(second, first_list):
+    """ Given a second SRE match, find an SRE match in first_list which
+        ends where the second starts.  If found, return (group, span), else
+        return the (group, span) for the second."""
+    i = second.span()[0]
+    for f in first_list:
+        if f.span()[1] == i:
+            return Custom_SRE_Match(f.group() + second.group(),
+                    (f.span()[0], second.span()[1]))
+    return Custom_SRE_Match(second.group(), second.span())
+
+def find_function_start(line):
+    """ Find the first start of a function. (Not a function prototype.) """
+    fs_gen = re.finditer(FUNCTION_START, line)
+    for function_start in fs_gen:
+        return function_start.span()[0], function_start.span()[1]
+    return None
+
+
+def parse_block(line, start):
+    """ Parse a block in line starting at index i. Return the indices of
+        said block.  """
+    i = start + 1
+    count = 1
+    while count > 0 and i < len(line):
+        if line[i] == '{':
+            count += 1
+        elif line[i] == '}':
+            count -= 1
+        i += 1
+    return (start, i)
+
+def parse_functions_with_bodies(line):
+    """ Return a generator which parses functions (with comments) from
+    code. Returns as a tuple: (function, start index, end index)."""
+    for possf in find_function_or_comment(line):
+        start = possf.span()[0]
+
+        fs = find_function_start(line[start:])
+        if fs is None:
+            continue
+
+        end = parse_block(line, start+fs[1])[1]
+        yield Custom_SRE_Match(line[start:end], (start, end))
+
+def replace_given_ranges(line, ranges):
+    """ Replaces the given ranges with spaces. """
+    ret = str(line)
+    for r in ranges:
+        a = r[0]
+        b = r[1] if r[1] < len(line) else len(line)-1
+        ret = ret[:a] + ' '*(b-a+1) + ret[b+1:]
+    return ret
+
+def function_name_from_body(line):
+    """ Given a function declaration, give the name of the function. """
+    func_regex = re.compile('(\w+)\s?\(')
+    return re.findall(func_regex, line)[0]
+
+
+def parse_function_blocks(line):
+    """ Return all function blocks in line. """
+    funcs = parse_functions_with_bodies(line)
+    ret = []
+    for func in funcs:
+        i = line.find('{', func.span()[0], func.span()[1])
+        ret.append(parse_block(line, i))
+    return ret
+
+def parse_function_block(line, span):
+    """ Return the block in the given span. """
+    i = line.find('{', span[0], span[1])
+    return parse_block(line, i)
+
+def find_all_comments(line, span=None):
+    """ Find all block and inline comments in the span. """
+    if span is None:
+        span = (0, len(line))
+    ret = list()
+    bc_gen = re.finditer(COMMENT, line[span[0]:span[1]])
+    ic_gen = re.finditer(INLINE_COMMENT, line[span[0]:span[1]])
+    for block_comment in bc_gen:
+        rmin, rmax = block_comment.span()
+        rmin += span[0]
+        rmax += span[0]
+        ret.append((rmin, rmax))
+    for inline_comment in ic_gen:
+        rmin, rmax = inline_comment.span()
+        rmin += span[0]
+        rmax += span[0]
+        ret.append((rmin, rmax))
+    ret.sort()
+    return ret
+
+
+def get_file_header(line):
+    """ Return the SRE_Match object corresponding to the header, if it exists.
+        Otherwise, return None. """
+    phead = None
+    comments = re.finditer(COMMENT, line)
+    try:
+        phead = next(comments)
+    except StopIteration as e:
+        phead = None
+    return phead
+
+
+def file_contains_header(line):
+    """ Return True if the file contains a comment at the start of the
+    the file, where the comment is not associated with a function."""
+    header = get_file_header(line)
+    if header is None:
+        return False
+
+    function_gen = parse_functions_with_bodies(line)
+    first_function = None
+    try:
+        first_function = next(function_gen)
+    except StopIteration as e:
+        return True
+
+    if first_function.span()[0] <= header.span()[0]:
+        return False
+    return True
+
+
+def header_contains_necessary_fields(header):
+    """ Return a list of strings describing the missing headers. """
+    lines = header.split('\n')
+    ret = []
+    for hsec in REQUIRED_HEADER_SECTIONS:
+        f = filter(lambda x : x.lstrip().startswith(hsec), lines)
+        try:
+            next(f)
+        except:
+            ret.append('header missing {}'.format(hsec))
+    return ret
+
+
+def all_lines_eighty_characters(line):
+    """ Return list of lines over eighty characters """
+    ret = list()
+    newlines = re.finditer(re.compile('\n'), line)
+    prev = 0
+    for newline in newlines:
+        if newline.span()[0] - prev > 80:
+            ret.append(
+                'Line over eighty characters {}'.format(newline.span()[0]))
+        prev = newline.span()[1]
+    return ret
+
+
+def no_global_functions(line):
+    funcs = parse_functions_with_bodies(line)
+    ranges = [a.span() for a in funcs]
+    line2 = replace_given_ranges(line, ranges)
+    ret = []
+    for proto in re.finditer(FUNCTION_PROTOTYPE, line2):
+        ret.append('Global function prototype {}'.format(proto.span()[0]))
+    return ret
+
+
+def two_lines_before_functions(program):
+    ss = re.compile('\s{2,}')
+    blanks = re.finditer(ss, program)
+    blanks = filter(lambda x : x.group().count('\n') >= 2, blanks)
+    blanks = [a for a in blanks]
+    funcs = parse_functions_with_bodies(program)
+    ret = list()
+    for func in funcs:
+        f = glue_backward(func, blanks)
+        if f.group() == func.group():
+            ret.append(
+                'Not two lines before function {}'.format(func.span()[0]))
+    return ret
+
+
+def comment_before_function(program):
+    funcs = find_function_or_comment(program)
+    l = list()
+    for func in funcs:
+        if not re.match(COMMENT, func.group()):
+            func_name = function_name_from_body(func.group())
+            # The offset is not in the original message.
+            l.append('Function {} missing documentation {}'.format(
+                func_name, func.span()[0]))
+    return l
+
+def comments_within_functions(program):
+    functions = parse_function_blocks(program)
+    ret = list()
+    for func in functions:
+        comms = find_all_comments(program, func)
+        for comment in comms:
+            ret.append('Comment within function {}'.format(comment[0]))
+    return ret
+
+
+def functions_twenty_five_lines(program):
+    NEWLINE = re.compile('\n')
+    bfuncs = parse_functions_with_bodies(program)
+    ret = list()
+    for bfunc in bfuncs:
+        block = parse_function_block(program, bfunc.span())
+        if len(re.findall(NEWLINE, program[block[0]:block[1]])) > 25:
+            fname = function_name_from_body(bfunc.group())
+            message = 'Function {} more than 25 lines {}'
+            ret.append(message.format(fname, bfunc.span()[0]))
+    return ret
+
+
+def original_error_list(program):
+    l = list()
+    if file_contains_header(program):
+        header = get_file_header(program)
+        l = header_contains_necessary_fields(header.group())
+    else:
+        l.append('File header missing.')
+
+    l.extend(comment_before_function(program))
+    l.extend(all_lines_eighty_characters(program))
+    l.extend(no_global_functions(program))
+    l.extend(two_lines_before_functions(program))
+    l.extend(comments_within_functions(program))
+    l.extend(functions_twenty_five_lines(program))
+    return l
+
+
+def error_list(program, rules=None):
+    """ Return the errors the original linter finds in program, each
+        prefixed with the line and column at which it occurs, as the
+        current error_list does.  rules is ignored. """
+    lines = LineIndex(program)
+    header = get_file_header(program)
+    ret = list()
+    for error in original_error_list(program):
+        m = ENDS_WITH_OFFSET.match(error)
+        if m is not None:
+            ret.append(lines.format(int(m.group(2)), m.group(1)))
+        elif error.startswith('header missing'):
+            ret.append(lines.format(header.span()[0], error))
+        else:
+            ret.append(lines.format(0, error))
+    return ret
+
+
+def normalize(error):
+    """ Return error, from either linter, as 'line: message'. """
+    m = LOCATED.match(error)
+    if m is None:
+        return error
+    return '{}: {}'.format(m.group(1), m.group(2).strip())
@@ -16,6 +16,8 @@ setup(
     entry_points={
         'console_scripts': [
             'rinter = rinter.rinter:_main',
+            'rinter-server = rinter.rinter_server:_serve_main',
+            'rinter-client = rinter.rinter_server:_client_main',
         ],
     },
 )
@@ -35,9 +35,11 @@ Among the items checked by rinter:
     * No mixing of case in variables and constants
     * Constants defined all upper case.
 """
-import argparse
-import re
+import bisect
+import collections
+import sys
 
+from rinter.rinter_profile import timed
 from rinter.rinter_utilities import *
 
 REQUIRED_HEADER_SECTIONS = [
@@ -51,35 +53,61 @@ REQUIRED_HEADER_SECTIONS = [
     'Errors handled',
     'Limitations'
     ]
-INDENTATION_LEVEL = re.compile(' {3}')
-
-
-def get_file_header(line):
-    """ Return the SRE_Match object corresponding to the header, if it exists.
+INDENTATION_LEVEL = 3
+RULES = collections.OrderedDict()
+
+
+class Rule(object):
+    """ A check registered in RULES: its name, the function which runs it,
+        the names of the ParsedProgram facts it is built on, and its scope.
+        A rule of scope 'function' only reports errors within a function
+        (and the whitespace before it), which depend on nothing else in
+        the program; a rule of scope 'file' may look at all of it. """
+
+    def __init__(self, name, check, facts, scope='file'):
+        self.name = name
+        self.check = check
+        self.facts = facts
+        self.scope = scope
+
+
+def rule(*facts, scope='file'):
+    """ Decorator which registers a check, under its own name, as a rule
+        built on the given facts. """
+    def register(check):
+        RULES[check.__name__] = Rule(check.__name__, check, facts, scope)
+        return check
+    return register
+
+
+def select_rules(select=None, ignore=None):
+    """ Return the names of the rules in select (or all of them), less
+        those in ignore, in the order they were registered. """
+    for name in list(select or []) + list(ignore or []):
+        if name not in RULES:
+            raise ValueError('Unknown rule {}'.format(name))
+    return [name for name in RULES
+            if (not select or name in select)
+            and (not ignore or name not in ignore)]
+
+
+def get_file_header(line, parsed=None):
+    """ Return the Token corresponding to the header, if it exists.
         Otherwise, return None. """
-    phead = None
-    comments = re.finditer(COMMENT, line)
-    try:
-        phead = next(comments)
-    except StopIteration as e:
-        phead = None
-    return phead
+    return parse_lines(parsed or line).header
 
 
-def file_contains_header(line):
+def file_contains_header(line, parsed=None):
     """ Return True if the file contains a comment at the start of the
     the file, where the comment is not associated with a function."""
-    header = get_file_header(line)
+    parsed = parse_lines(parsed or line)
+    header = parsed.header
     if header is None:
         return False
-
-    function_gen = parse_functions_with_bodies(line)
-    first_function = None
-    try:
-        first_function = next(function_gen)
-    except StopIteration as e:
+    if not parsed.functions:
         return True
 
+    first_function = parsed.functions[0][0]
     if first_function.span()[0] <= header.span()[0]:
         return False
     return True
@@ -98,106 +126,336 @@ def header_contains_necessary_fields(header):
     return ret
 
 
-def all_lines_eighty_characters(line):
+@rule('header', 'functions', 'lines')
+def file_header(program, parsed=None):
+    """ Return list of problems with the file header. """
+    parsed = parse_lines(parsed or program)
+    if not file_contains_header(program, parsed):
+        return [parsed.lines.format(0, 'File header missing.')]
+    header = parsed.header
+    return [parsed.lines.format(header.span()[0], error)
+            for error in header_contains_necessary_fields(header.group())]
+
+
+@rule('tree', 'lines', scope='function')
+def comment_before_function(program, parsed=None):
+    parsed = parse_lines(parsed or program)
+    l = list()
+    for func in parsed.tree.walk('function'):
+        # A function's span takes in its comment, so it starts with one.
+        if not COMMENT.match(parsed.program, func.start, func.end):
+            l.append(parsed.lines.format(func.start,
+                'Function {} missing documentation'.format(func.name)))
+    return l
+
+
+@rule('lines')
+def all_lines_eighty_characters(line, parsed=None):
     """ Return list of lines over eighty characters """
+    lines = parse_lines(parsed or line).lines
     ret = list()
-    newlines = re.finditer(re.compile('\n'), line)
+    for start, end in lines.lines():
+        if end - start > 80:
+            ret.append(lines.format(start + 80, 'Line over eighty characters'))
+    return ret
+
+
+@rule('prototypes', 'included', 'lines')
+def no_global_functions(line, parsed=None):
+    """ Return list of function prototypes outside of any function, except
+        for functions which an included local header declares. """
+    parsed = parse_lines(parsed or line)
+    declared = set()
+    for header in parsed.included:
+        declared.update(header.prototypes)
+    return [parsed.lines.format(proto.span()[0], 'Global function prototype')
+            for proto in parsed.prototypes
+            if not declared
+            or function_name_from_body(proto.group()) not in declared]
+
+
+@rule('tokens', 'functions', 'lines', scope='function')
+def two_lines_before_functions(program, parsed=None):
+    parsed = parse_lines(parsed or program)
+    lines = parsed.lines
+    blanks = list()
     prev = 0
-    for newline in newlines:
-        if newline.span()[0] - prev > 80:
-            ret.append(
-                'Line over eighty characters {}'.format(newline.span()[0]))
-        prev = newline.span()[1]
+    for token in parsed.tokens:
+        if token.kind == 'newline':
+            continue
+        start = token.span()[0]
+        if lines.line_number(start) - lines.line_number(prev) >= 2:
+            blanks.append(Span(program, prev, start))
+        prev = token.span()[1]
+    blanks = SpanIndex(blanks)
+    ret = list()
+    for func, _, _ in parsed.functions:
+        f = glue_backward(func, blanks)
+        if f is func:
+            ret.append(lines.format(func.span()[0],
+                                    'Not two lines before function'))
     return ret
 
 
-def no_global_functions(line):
-    funcs = parse_functions_with_bodies(line)
-    ranges = [a.span() for a in funcs]
-    line2 = replace_given_ranges(line, ranges)
-    ret = []
-    for proto in re.finditer(FUNCTION_PROTOTYPE, line2):
-        ret.append('Global function prototype {}'.format(proto.span()[0]))
+@rule('indentation', 'lines')
+def indentation_level_three_spaces(program, parsed=None):
+    """ Return list of lines not indented by three spaces for each level
+        of nesting.  Lines which continue a statement may be indented
+        further. """
+    parsed = parse_lines(parsed or program)
+    ret = list()
+    for start, token, level, continued in parsed.indentation:
+        indent = parsed.program[start:token.span()[0]]
+        expected = ' ' * (INDENTATION_LEVEL * level)
+        if indent == expected or (continued and indent.startswith(expected)
+                                  and not indent.strip(' ')):
+            continue
+        if '\t' in indent:
+            message = 'Line indented with tabs'
+        else:
+            message = 'Line indented {} spaces, expected {}'.format(
+                len(indent), len(expected))
+        ret.append(parsed.lines.format(token.span()[0], message))
     return ret
 
 
-def two_lines_before_functions(program):
-    ss = re.compile('\s{2,}')
-    blanks = re.finditer(ss, program)
-    blanks = filter(lambda x : x.group().count('\n') >= 2, blanks)
-    blanks = [a for a in blanks]
-    funcs = parse_functions_with_bodies(program)
+@rule('comments', 'tree', 'lines', scope='function')
+def comments_within_functions(program, parsed=None):
+    parsed = parse_lines(parsed or program)
+    comments = parsed.comments
+    starts = [a[0] for a in comments]
     ret = list()
-    for func in funcs:
-        f = glue_backward(func, blanks)
-        if f.group() == func.group():
-            ret.append(
-                'Not two lines before function {}'.format(func.span()[0]))
+    for func in parsed.tree.walk('function'):
+        i = bisect.bisect_left(starts, func.body)
+        while i < len(comments) and comments[i][0] < func.end:
+            if comments[i][1] <= func.end:
+                ret.append(parsed.lines.format(comments[i][0],
+                                               'Comment within function'))
+            i += 1
     return ret
 
 
-def indentation_level_three_spaces(line):
-    pass
+@rule('tree', 'lines', scope='function')
+def functions_twenty_five_lines(program, parsed=None):
+    parsed = parse_lines(parsed or program)
+    lines = parsed.lines
+    ret = list()
+    for func in parsed.tree.walk('function'):
+        length = lines.line_number(func.end) - lines.line_number(func.body)
+        if length > 25:
+            message = 'Function {} more than 25 lines'.format(func.name)
+            ret.append(lines.format(func.start, message))
+    return ret
 
 
-def comment_before_function(program):
-    funcs = find_function_or_comment(program)
-    l = list()
-    for func in funcs:
-        if not re.match(COMMENT, func.group()):
-            func_name = function_name_from_body(func.group())
-            l.append('Function {} missing documentation'.format(func_name))
-    return l
+@rule('braces', 'lines')
+def balanced_braces(program, parsed=None):
+    """ Return list of braces which have no matching brace. """
+    parsed = parse_lines(parsed or program)
+    return [parsed.lines.format(a, 'Unmatched brace')
+            for a in parsed.braces.unmatched]
+
 
-def comments_within_functions(program):
-    functions = parse_function_blocks(program)
+@rule('declarations', 'lines', scope='function')
+def variables_declared_alphabetically(program, parsed=None):
+    """ Return list of variables declared after a variable, in the same
+        block, whose name comes later in the alphabet. """
+    parsed = parse_lines(parsed or program)
     ret = list()
-    for func in functions:
-        comms = find_all_comments(program, func)
-        for comment in comms:
-            ret.append('Comment within function {}'.format(comment[0]))
+    last = dict()
+    for block, name in parsed.declarations:
+        text = name.group().lower()
+        if block in last and text < last[block]:
+            ret.append(parsed.lines.format(name.span()[0],
+                'Variable {} not declared in alphabetical order'.format(
+                    name.group())))
+        else:
+            last[block] = text
     return ret
 
 
-def functions_twenty_five_lines(program):
-    NEWLINE = re.compile('\n')
-    bfuncs = parse_functions_with_bodies(program)
+@rule('declarations', 'lines', scope='function')
+def no_mixed_case_variables(program, parsed=None):
+    """ Return list of variables whose names mix upper and lower case. """
+    parsed = parse_lines(parsed or program)
     ret = list()
-    for bfunc in bfuncs:
-        block = parse_function_block(program, bfunc.span())
-        if len(re.findall(NEWLINE, program[block[0]:block[1]])) > 25:
-            fname = function_name_from_body(bfunc.group())
-            message = 'Function {} more than 25 lines {}'
-            ret.append(message.format(fname, bfunc.span()[0]))
+    for _, name in parsed.declarations:
+        text = name.group()
+        if text.lower() != text and text.upper() != text:
+            ret.append(parsed.lines.format(name.span()[0],
+                'Variable {} mixes upper and lower case'.format(text)))
     return ret
 
 
-def error_list(program):
-    l = list()
-    if file_contains_header(program):
-        header = get_file_header(program)
-        l = header_contains_necessary_fields(header.group())
-    else:
-        l.append('File header missing.')
-
-    l.extend(comment_before_function(program))
-    l.extend(all_lines_eighty_characters(program))
-    l.extend(no_global_functions(program))
-    l.extend(two_lines_before_functions(program))
-    l.extend(comments_within_functions(program))
-    l.extend(functions_twenty_five_lines(program))
-    return l
+@rule('macros', 'lines')
+def constants_upper_case(program, parsed=None):
+    """ Return list of constants (#define) which are not all upper case. """
+    parsed = parse_lines(parsed or program)
+    return [parsed.lines.format(name.span()[0],
+                'Constant {} not all upper case'.format(name.group()))
+            for name in parsed.macros if name.group().upper() != name.group()]
+
+
+def iter_errors(program, rules=None):
+    """ Return a generator of the errors found in program by the named
+        rules (by default, all of them), each prefixed with the line and
+        column at which it occurs.  The errors of each rule are yielded as
+        soon as it has run, in the order the rules are registered (not in
+        the order of their locations), so a caller which stops early skips
+        the rules left, and only the facts the rules run need are
+        computed. """
+    parsed = parse_lines(program)
+    size = len(parsed.program)
+    for name in rules or RULES:
+        r = RULES[name]
+        for f in r.facts:
+            if not parsed.has(f):
+                with timed(f, size):
+                    parsed[f]
+        with timed(name, size):
+            errors = r.check(parsed.program, parsed)
+        yield from errors
+
+
+def error_list(program, rules=None):
+    """ Return the list of errors found in program by the named rules (by
+        default, all of them), each prefixed with the line and column at
+        which it occurs. """
+    return list(iter_errors(program, rules))
 
 
 def _main():
+    import argparse
     parser = argparse.ArgumentParser(description='Lint utility for CPS360.')
 
     parser.add_argument('-f', nargs='?', help='The filename for the program')
+    parser.add_argument('paths', nargs='*',
+                        help='Files, directories or glob patterns to lint')
+    parser.add_argument('--git', metavar='RANGE', default=None,
+                        help='Also lint the C files changed in the revision '
+                             'range RANGE (A..B, or A for A..HEAD), read '
+                             'from the git object store')
+    parser.add_argument('--repo', default='.',
+                        help='Repository for --git (default: .)')
+    parser.add_argument('--fix', action='store_true',
+                        help='Fix the errors which can be fixed (blank lines '
+                             'before functions, long comments, header '
+                             'fields) in place, then lint the files')
+    parser.add_argument('--includes', action='store_true',
+                        help='Read the local headers each file includes '
+                             'with quotes, from its directory')
+    parser.add_argument('-I', '--include-dir', action='append', default=[],
+                        help='Also look for local headers in this '
+                             'directory (implies --includes)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Number of worker processes for batch linting '
+                             '(default: one per core)')
+    parser.add_argument('--chunk-size', type=int, default=None,
+                        metavar='CHARS',
+                        help='Lint files longer than CHARS characters in '
+                             'chunks split between top-level blocks, to '
+                             'bound memory (with -j, the chunks of a single '
+                             'file are linted in parallel)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Do not use or update the result cache')
+    parser.add_argument('--cache-dir', default=None,
+                        help='Directory of the result cache')
+    parser.add_argument('--timeout', type=float, default=10,
+                        help='Seconds to spend linting (or fixing) one file '
+                             'before giving up on it (default: 10, 0 for no '
+                             'limit)')
+    parser.add_argument('--select', default=None,
+                        help='Comma separated names of the only rules to run '
+                             '(one of: {})'.format(', '.join(RULES)))
+    parser.add_argument('--ignore', default=None,
+                        help='Comma separated names of rules not to run')
+    parser.add_argument('--max-errors', type=int, default=None,
+                        help='Stop linting once this many errors have been '
+                             'reported; the first errors of each file by '
+                             'location are reported')
+    parser.add_argument('--fail-fast', action='store_true',
+                        help='Stop linting at the first error found, which '
+                             'need not be the first in the file')
+    parser.add_argument('--format', choices=['text', 'jsonl'],
+                        default='text',
+                        help='Print errors as text, or as JSON objects one '
+                             'per line')
+    parser.add_argument('--profile', action='store_true',
+                        help='Print the time spent in each check, and the '
+                             'calls of each parsing helper, to stderr')
+    parser.add_argument('--profile-format', choices=['table', 'json'],
+                        default='table', help='Format of --profile')
 
     args = parser.parse_args()
 
-    if args.f:
-        program = load_file(args.f)
-        l = error_list(program)
-        l.sort()
-        print('\n'.join(l))
+    try:
+        rules = select_rules(args.select and args.select.split(','),
+                             args.ignore and args.ignore.split(','))
+    except ValueError as e:
+        parser.error(str(e))
+    max_errors = 1 if args.fail_fast else args.max_errors
+    if max_errors is not None and max_errors < 1:
+        parser.error('--max-errors must be at least 1')
+    if args.chunk_size is not None and args.chunk_size < 1:
+        parser.error('--chunk-size must be at least 1')
+
+    from rinter.rinter_cache import DEFAULT_CACHE_DIR, ResultCache
+    cache = None
+    if not args.no_cache:
+        cache = ResultCache(args.cache_dir or DEFAULT_CACHE_DIR)
+
+    profiler = None
+    if args.profile:
+        from rinter.rinter_profile import Profiler
+        profiler = Profiler()
+
+    from rinter.rinter_batch import (expand_paths, format_failure,
+                                     is_archive, lint_files, print_results)
+    filenames = expand_paths(([args.f] if args.f else []) + args.paths)
+    if args.git:
+        from rinter.rinter_git import GitError, changed_programs
+        try:
+            filenames.extend(changed_programs(args.git, args.repo))
+        except GitError as e:
+            parser.error(str(e))
+    unreadable = 0
+    if any(isinstance(f, str) and is_archive(f) for f in filenames):
+        from rinter.rinter_archive import ArchiveError, archive_programs
+        expanded = list()
+        for f in filenames:
+            if not (isinstance(f, str) and is_archive(f)):
+                expanded.append(f)
+                continue
+            try:
+                expanded.extend(archive_programs(f))
+            except ArchiveError as e:
+                print(format_failure(f, str(e), args.format))
+                unreadable += 1
+        filenames = expanded
+    if args.fix:
+        from rinter.rinter_fix import fix_files
+        on_disk = [f for f in filenames if isinstance(f, str) and f != '-']
+        for filename, _, failure in fix_files(on_disk, args.jobs, rules,
+                                                 args.timeout):
+            if failure is not None:
+                print('{}: could not be fixed: {}'.format(filename, failure),
+                      file=sys.stderr)
+    include_path = None
+    if args.includes or args.include_dir:
+        include_path = args.include_dir
+    results = lint_files(filenames, args.jobs, cache, args.timeout, profiler,
+                         rules, max_errors=max_errors,
+                         include_path=include_path,
+                         chunk_size=args.chunk_size,
+                         fail_fast=args.fail_fast)
+    try:
+        reported = print_results(results, max_errors, args.format)
+    finally:
+        results.close()
+
+    if profiler is not None:
+        if args.profile_format == 'json':
+            print(profiler.json(), file=sys.stderr)
+        else:
+            print(profiler.table(), file=sys.stderr)
+    return 1 if reported or unreadable else 0
@@ -0,0 +1,41 @@
+__package__='rinter.rinter_archive'
+"""
+Linting the C files inside zip and tar archives, read straight from the
+archive: nothing is extracted to disk.
+"""
+import tarfile
+import zipfile
+
+from rinter.rinter_utilities import decode_program
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def member_name(path, member):
+    """ Return the name under which member of the archive path is
+        reported. """
+    return '{}:{}'.format(path, member)
+
+
+def archive_programs(path):
+    """ Return a generator of (name, program) pairs for the C files in the
+        zip or tar archive path, in the order they are stored, where name
+        is member_name(path, member).  Tar archives, compressed or not,
+        are read in a single pass. """
+    try:
+        if path.lower().endswith('.zip'):
+            with zipfile.ZipFile(path) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir() and info.filename.endswith('.c'):
+                        yield (member_name(path, info.filename),
+                               decode_program(archive.read(info)))
+        else:
+            with tarfile.open(path, 'r|*') as archive:
+                for info in archive:
+                    if info.isfile() and info.name.endswith('.c'):
+                        yield (member_name(path, info.name),
+                               decode_program(archive.extractfile(info).read()))
+    except (OSError, EOFError, zipfile.BadZipFile, tarfile.TarError) as e:
+        raise ArchiveError('{}: {}'.format(type(e).__name__, e))
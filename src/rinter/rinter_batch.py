@@ -0,0 +1,224 @@
+__package__='rinter.rinter_batch'
+"""
+Batch linting of many programs, spread over a pool of worker processes.
+"""
+import contextlib
+import functools
+import glob
+import json
+import multiprocessing
+import os
+import signal
+import threading
+
+from rinter.rinter import error_list
+from rinter.rinter_cache import cached_error_list
+from rinter.rinter_chunk import iter_chunked_errors
+from rinter.rinter_incremental import incremental_error_list
+from rinter.rinter_profile import Profiler, profiling
+from rinter.rinter_utilities import ParsedProgram, load_file, location_key
+
+
+# Archives whose C files are linted without extracting them, by
+# rinter_archive.
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2',
+                    '.tar.xz', '.txz')
+
+
+def is_archive(path):
+    """ Return True if path names a zip or tar archive. """
+    return path.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def is_program(path):
+    """ Return True if path names a C file or an archive of them. """
+    return path.endswith('.c') or is_archive(path)
+
+
+def expand_paths(paths):
+    """ Return the list of C files and archives named by paths, which may
+        be files, directories (searched recursively) or glob patterns.  A
+        glob pattern's matches are treated like directories and files
+        named directly, except that only the matching C files and archives
+        are kept.  Files are returned once each, in a deterministic
+        order. """
+    ret = list()
+    seen = set()
+    for path in paths:
+        magic = glob.has_magic(path)
+        matches = glob.glob(path, recursive=True) if magic else [path]
+        found = list()
+        for match in matches:
+            if os.path.isdir(match):
+                for root, dirs, files in os.walk(match):
+                    found.extend(os.path.join(root, f) for f in files
+                                 if is_program(f))
+            elif not magic or is_program(match):
+                found.append(match)
+        for f in sorted(found):
+            if f not in seen:
+                seen.add(f)
+                ret.append(f)
+    return ret
+
+
+class LintTimeout(Exception):
+    pass
+
+
+@contextlib.contextmanager
+def time_budget(seconds):
+    """ Raise LintTimeout in the body if it runs for more than seconds.
+        The budget relies on SIGALRM, so it is only enforced in the main
+        thread on platforms which have it. """
+    if (not seconds or not hasattr(signal, 'setitimer')
+            or threading.current_thread() is not threading.main_thread()):
+        yield
+        return
+
+    def expire(signum, frame):
+        raise LintTimeout()
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def lint_file(filename, cache=None, timeout=None, program=None, rules=None,
+              incremental=False, max_errors=None, include_path=None,
+              chunk_size=None, pool=None, fail_fast=False):
+    """ Lint the given file.  Return a tuple (filename, errors, failure),
+        where failure describes why the file could not be linted, or is
+        None if it was linted.  If cache is given, it is a ResultCache
+        to answer the file from.  If linting takes more than timeout
+        seconds, it is abandoned and reported as a single error.  If
+        program is given, it is linted instead of reading filename.  rules
+        names the rules to run, by default all of them.  If incremental is
+        True, the errors in functions linted before by this process are
+        answered from its FunctionCache.  If max_errors is given, only
+        the first max_errors errors by location are returned; if
+        fail_fast is True, linting stops at the first error found.  If
+        include_path is given, the local headers the program includes are
+        looked for next to filename, and then in the directories of
+        include_path.  If
+        chunk_size is given, a program longer than chunk_size characters
+        is linted in chunks of about that size, on pool if given. """
+    lint = incremental_error_list if incremental else error_list
+    try:
+        if program is None:
+            program = load_file(filename)
+        if chunk_size and len(program) > chunk_size:
+            lint = functools.partial(iter_chunked_errors, size=chunk_size,
+                                     pool=pool)
+        if include_path is not None:
+            directory = os.path.dirname(filename) or os.curdir
+            program = ParsedProgram(program, [directory] + include_path)
+        with time_budget(timeout):
+            errors = cached_error_list(program, cache, rules, lint,
+                                       max_errors, fail_fast)
+    except LintTimeout:
+        return (filename,
+                ['1:1: Lint timed out after {} seconds'.format(timeout)], None)
+    except Exception as e:
+        return (filename, [], '{}: {}'.format(type(e).__name__, e))
+    errors.sort(key=location_key)
+    return (filename, errors, None)
+
+
+def _lint_source(source, profile=False, **kwargs):
+    """ Lint source, which is either a filename or a (name, program)
+        pair.  If profile is True, return the result of lint_file along
+        with the measurements of a Profiler active while it ran. """
+    if isinstance(source, tuple):
+        kwargs['program'] = source[1]
+        source = source[0]
+    if not profile:
+        return lint_file(source, **kwargs)
+    with profiling(Profiler()) as profiler:
+        result = lint_file(source, **kwargs)
+    return result, profiler.as_dict()
+
+
+def lint_files(filenames, jobs=None, cache=None, timeout=None, profiler=None,
+               rules=None, pool=None, incremental=False, max_errors=None,
+               include_path=None, chunk_size=None, fail_fast=False):
+    """ Return a generator of lint_file results for filenames, in the same
+        order as filenames.  Files are linted by jobs worker processes
+        (by default, one per core); if jobs is 1, they are linted in this
+        process.  If profiler is given, the measurements of every file
+        are added to it.  Besides filenames, the list may hold (name,
+        program) pairs for programs which do not come from a file; '-'
+        is read from stdin before any worker starts.  rules names the
+        rules to run, by default all of them.  If pool is given, it is a
+        multiprocessing.Pool to lint on, which is left running.
+        incremental, max_errors, include_path, chunk_size and fail_fast
+        are passed on to lint_file; the chunks of a single file are linted on the
+        pool.  Closing the generator stops linting the files left. """
+    filenames = [('-', load_file('-')) if f == '-' else f for f in filenames]
+    lint = functools.partial(_lint_source, profile=profiler is not None,
+                             cache=cache, timeout=timeout, rules=rules,
+                             incremental=incremental, max_errors=max_errors,
+                             include_path=include_path,
+                             chunk_size=chunk_size, fail_fast=fail_fast)
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    owned = None
+    if pool is None and jobs > 1 and (len(filenames) > 1 or chunk_size):
+        owned = pool = multiprocessing.Pool(jobs)
+    if pool is None or len(filenames) <= 1:
+        if chunk_size:
+            lint = functools.partial(lint, pool=pool)
+        results = map(lint, filenames)
+    else:
+        chunksize = max(1, len(filenames) // (jobs * 4))
+        results = pool.imap(lint, filenames, chunksize)
+    try:
+        for result in results:
+            if profiler is not None:
+                result, measurements = result
+                profiler.merge(measurements)
+            yield result
+    finally:
+        if owned is not None:
+            owned.terminate()
+
+
+def format_error(filename, error, format='text'):
+    """ Return error, found in filename, as a line of text, or as a JSON
+        object if format is 'jsonl'. """
+    if format != 'jsonl':
+        return '{}:{}'.format(filename, error)
+    line, col, message = location_key(error)
+    return json.dumps({'file': filename, 'line': line, 'column': col,
+                       'message': message.strip()})
+
+
+def format_failure(filename, failure, format='text'):
+    """ Return the reason filename could not be linted as a line of text,
+        or as a JSON object if format is 'jsonl'. """
+    if format != 'jsonl':
+        return '{}: could not be linted: {}'.format(filename, failure)
+    return json.dumps({'file': filename, 'failure': failure})
+
+
+def print_results(results, max_errors=None, format='text'):
+    """ Print the results of lint_files as they arrive, one line per error
+        and per file which could not be linted.  If max_errors is given,
+        stop once that many have been printed.  Return the number
+        printed. """
+    reported = 0
+    for filename, errors, failure in results:
+        lines = [format_error(filename, e, format) for e in errors]
+        if failure is not None:
+            lines.insert(0, format_failure(filename, failure, format))
+        for line in lines[:None if max_errors is None
+                          else max_errors - reported]:
+            print(line)
+            reported += 1
+        if max_errors is not None and reported >= max_errors:
+            break
+    return reported
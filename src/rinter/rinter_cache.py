@@ -0,0 +1,203 @@
+__package__='rinter.rinter_cache'
+"""
+On-disk cache of error_list results, keyed by the content of the program,
+the source of the rules and which of them were run.
+"""
+import hashlib
+import itertools
+import json
+import os
+import tempfile
+
+from rinter import __version__
+from rinter.rinter import RULES, error_list, iter_errors
+from rinter.rinter_include import header_stamps
+from rinter.rinter_profile import count
+from rinter.rinter_utilities import ParsedProgram, location_key
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+    'rinter')
+DEFAULT_MAX_SIZE = 32 * 1024 * 1024
+# The modules whose source decides which errors are reported, and how.
+RULE_MODULES = ('rinter.py', 'rinter_utilities.py', 'rinter_include.py',
+                'rinter_chunk.py', 'rinter_incremental.py')
+
+_rules_digest = None
+
+
+def rules_digest():
+    """ Return a digest of the installed source of RULE_MODULES, so that
+        results cached by another version of the rules are not used.  It
+        is computed once per process. """
+    global _rules_digest
+    if _rules_digest is None:
+        h = hashlib.sha256(__version__.encode())
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for name in RULE_MODULES:
+            try:
+                with open(os.path.join(directory, name), 'rb') as fin:
+                    h.update(fin.read())
+            except OSError:
+                h.update(name.encode())
+        _rules_digest = h.hexdigest()
+    return _rules_digest
+
+
+class ResultCache(object):
+    """ A directory of cached results, holding at most max_size bytes.
+        When it grows past that, the least recently used entries are
+        evicted.  The total size of the entries is kept in an index file,
+        so that no process has to walk the cache to learn it; updates to
+        it from processes writing at the same time may be lost, and the
+        total is counted again whenever entries are evicted. """
+
+    INDEX = 'size'
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+
+    def key(self, program, rules=None):
+        """ Return the cache key for running the named rules (by default,
+            all of them) over program, which is either a string or a
+            ParsedProgram.  The key of a ParsedProgram with an include_path
+            also depends on the headers it includes. """
+        headers = ''
+        if isinstance(program, ParsedProgram):
+            if program.include_path is not None:
+                headers = header_stamps(program.included)
+            program = program.program
+        rules = rules or list(RULES)
+        h = hashlib.sha256()
+        h.update(rules_digest().encode())
+        h.update(b'\0')
+        h.update(','.join(rules).encode())
+        h.update(b'\0')
+        h.update(program.encode('utf-8', 'surrogatepass'))
+        if headers:
+            h.update(b'\0')
+            h.update(headers.encode('utf-8', 'surrogatepass'))
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        """ Return the cached errors for key, or None if there are none. """
+        path = self.path(key)
+        try:
+            with open(path, 'r') as fin:
+                errors = json.load(fin)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return errors
+
+    def write(self, path, data):
+        """ Replace the file path with data, atomically. """
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'w') as fout:
+                fout.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def size(self):
+        """ Return the total size of the entries, as the index records it,
+            or None if there is no index. """
+        try:
+            with open(os.path.join(self.directory, self.INDEX)) as fin:
+                return int(fin.read())
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, errors):
+        """ Store errors under key, evicting old entries if necessary. """
+        path = self.path(key)
+        data = json.dumps(errors)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                replaced = os.stat(path).st_size
+            except OSError:
+                replaced = 0
+            self.write(path, data)
+            size = self.size()
+            if size is None:
+                size = sum(e[1] for e in self.entries())
+            else:
+                size += len(data) - replaced
+            if size > self.max_size:
+                self.evict()
+            else:
+                self.write(os.path.join(self.directory, self.INDEX),
+                           str(size))
+        except OSError:
+            return
+
+    def entries(self):
+        """ Return a list of (last used, size, path) for each entry. """
+        ret = list()
+        for root, dirs, files in os.walk(self.directory):
+            for f in files:
+                if root == self.directory and f == self.INDEX:
+                    continue
+                try:
+                    st = os.stat(os.path.join(root, f))
+                except OSError:
+                    continue
+                ret.append((st.st_mtime, st.st_size, os.path.join(root, f)))
+        return ret
+
+    def evict(self):
+        """ Remove the least recently used entries until the cache is
+            back down to three quarters of max_size. """
+        entries = sorted(self.entries())
+        total = sum(e[1] for e in entries)
+        for mtime, size, path in entries:
+            if total <= self.max_size * 3 // 4:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self.write(os.path.join(self.directory, self.INDEX), str(total))
+
+
+def cached_error_list(program, cache=None, rules=None, lint=error_list,
+                      max_errors=None, fail_fast=False):
+    """ Return error_list(program, rules), answered from cache if
+        possible.  Otherwise the errors are found by lint, which takes the
+        same arguments as error_list, and may return any iterable of them.
+        If max_errors is given, only the first max_errors errors by
+        location are returned.  Every rule still has to run to know which
+        errors come first, so the full list is found and cached.  If
+        fail_fast is True, only whether there are any errors matters:
+        linting stops at the first error found, whatever its location, and
+        only that error is returned. """
+    key = errors = None
+    if fail_fast:
+        max_errors = 1
+    if cache is not None:
+        key = cache.key(program, rules)
+        errors = cache.get(key)
+    if errors is not None:
+        count('cache hit')
+    elif fail_fast:
+        if lint is error_list:
+            lint = iter_errors
+        errors = list(itertools.islice(lint(program, rules), 1))
+        # Only a program without errors was linted in full.
+        if cache is not None and not errors:
+            cache.put(key, errors)
+    else:
+        errors = list(lint(program, rules))
+        if cache is not None:
+            cache.put(key, errors)
+    if max_errors is not None:
+        errors = sorted(errors, key=location_key)[:max_errors]
+    return errors
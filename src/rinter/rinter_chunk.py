@@ -0,0 +1,130 @@
+__package__='rinter.rinter_chunk'
+"""
+Linting of very large programs in chunks, split between top-level blocks.
+Only one chunk is parsed at a time (or one per worker, given a pool), so
+the memory taken by the facts of a program stays bounded however long it
+is.
+"""
+import functools
+
+from rinter.rinter import RULES, error_list
+from rinter.rinter_utilities import (STATEMENT_END, TOKEN, ParsedProgram,
+                                     Token, function_headers, location_key)
+
+DEFAULT_CHUNK_SIZE = 256 * 1024
+
+# Rules which look at the start of the program, and are run over the first
+# chunk only.
+FIRST_CHUNK_RULES = frozenset(['file_header'])
+
+
+def chunk_boundaries(program, size=DEFAULT_CHUNK_SIZE, start=0):
+    """ Return a generator of the offsets at which program can be split
+        into chunks of at least size characters.  Each chunk ends with a
+        '}' which closes a top-level block and ends its line, outside of
+        parentheses and preprocessor lines, so no token, line, function or
+        indentation level is split.  The first chunk holds the file header
+        or the first function, so that file_header finds over it what it
+        would over the whole program.  The program is scanned once, and
+        its tokens are not kept.  If start is given, it is a boundary
+        found before, and the scan resumes from it; for a size of 1,
+        nothing before a boundary changes where the ones after it are. """
+    depth = parens = 0
+    last = start
+    decided = start > 0
+    directive = False
+    first = True
+    window = list()
+    for m in TOKEN.finditer(program, start):
+        kind = m.lastgroup
+        if kind == 'newline':
+            first = True
+            directive = False
+            continue
+        if first:
+            first = False
+            directive = kind == 'other' and m.group() == '#'
+        if not decided:
+            # window holds the tokens since the last statement ended, in
+            # which a function header would be.
+            window.append(Token(kind, program, m.start(), m.end()))
+            if kind == 'comment' or (kind == 'open_brace' and not depth
+                                     and function_headers(window)):
+                decided = True
+            elif kind in STATEMENT_END:
+                window = list()
+        if kind == 'open_brace':
+            depth += 1
+        elif kind == 'open_paren' and not directive:
+            parens += 1
+        elif kind == 'close_paren' and not directive:
+            parens = max(0, parens - 1)
+        elif kind == 'close_brace' and depth:
+            depth -= 1
+            end = m.end()
+            if (not depth and not parens and not directive and decided
+                    and end - last >= size
+                    and program.startswith('\n', end)):
+                yield end
+                last = end
+
+
+def split_program(program, size=DEFAULT_CHUNK_SIZE):
+    """ Return a generator of (line, column, chunk) triples, where the
+        chunks, at least size characters long but for the last, make up
+        program, and line and column are where each starts in it. """
+    start = 0
+    line = column = 1
+    for end in chunk_boundaries(program, size):
+        yield line, column, program[start:end]
+        line += program.count('\n', start, end)
+        column = end - program.rfind('\n', 0, end)
+        start = end
+    yield line, column, program[start:]
+
+
+def shift_error(error, line, column):
+    """ Return error, found in a chunk which starts at line and column of
+        a program, with its location in the program. """
+    l, c, message = location_key(error)
+    if l == 1:
+        c += column - 1
+    return '{}:{}:{}'.format(l + line - 1, c, message)
+
+
+def chunk_errors(chunk, rules, included=None):
+    """ Return the errors the named rules find in chunk, a (line, column,
+        text) triple from split_program, located in the whole program.  If
+        given, included is the list of Headers the program includes. """
+    line, column, text = chunk
+    if (line, column) != (1, 1):
+        rules = [r for r in rules if r not in FIRST_CHUNK_RULES]
+    parsed = ParsedProgram(text)
+    if included is not None:
+        # The #includes are in the first chunk, but name the headers of
+        # the whole program.
+        parsed.facts['included'] = included
+    return [shift_error(e, line, column) for e in error_list(parsed, rules)]
+
+
+def iter_chunked_errors(program, rules=None, size=DEFAULT_CHUNK_SIZE,
+                        pool=None):
+    """ Return a generator of the errors error_list(program, rules) would
+        find, linting program one chunk of about size characters at a
+        time; on pool, a multiprocessing.Pool, if given.  The errors of
+        each chunk are yielded as soon as it has been linted, so their
+        order may differ. """
+    included = None
+    if isinstance(program, ParsedProgram):
+        if program.include_path is not None:
+            included = program.included
+        program = program.program
+    lint = functools.partial(chunk_errors, rules=list(rules or RULES),
+                             included=included)
+    chunks = split_program(program, size)
+    if pool is None:
+        results = map(lint, chunks)
+    else:
+        results = pool.imap(lint, chunks)
+    for errors in results:
+        yield from errors
@@ -0,0 +1,251 @@
+__package__='rinter.rinter_fix'
+"""
+Automatic fixes for the mechanical errors: missing blank lines before
+functions, comments which run past eighty characters, and missing header
+fields.  The fixes for a program are collected as a list of edits, by
+offset in the program as it was read, and all applied in a single
+rebuild.
+"""
+import bisect
+import collections
+import functools
+import multiprocessing
+import os
+import tempfile
+
+from rinter.rinter import REQUIRED_HEADER_SECTIONS, RULES, error_list
+from rinter.rinter import file_contains_header
+from rinter.rinter_batch import LintTimeout, time_budget
+from rinter.rinter_utilities import decode_program, parse_lines
+
+LINE_LENGTH = 80
+HEADER_INDENT = '   '
+
+
+class FixError(Exception):
+    pass
+
+
+def apply_edits(program, edits):
+    """ Return program with edits, a list of (start, end, text) tuples,
+        applied: each replaces program[start:end] with text.  The edits
+        are applied in order of their offsets, all at once; an edit which
+        overlaps one before it is left out.  Edits at the same offset are
+        applied in the order given. """
+    pieces = list()
+    last = 0
+    for start, end, text in sorted(edits, key=lambda e: e[:2]):
+        if start < last:
+            continue
+        pieces.append(program[last:start])
+        pieces.append(text)
+        last = end
+    pieces.append(program[last:])
+    return ''.join(pieces)
+
+
+def header_edits(parsed):
+    """ Return the edits which add a header to parsed, or the fields its
+        header is missing.  A missing field is put before the first field
+        which should come after it, or else at the end of the header. """
+    program = parsed.program
+    if not file_contains_header(program, parsed):
+        fields = ''.join('{}{}:\n'.format(HEADER_INDENT, section)
+                         for section in REQUIRED_HEADER_SECTIONS)
+        return [(0, 0, '/*\n' + fields + '*/\n\n\n')]
+    header = parsed.header
+    found = dict()
+    start = header.start
+    for line in header.group().split('\n'):
+        for section in REQUIRED_HEADER_SECTIONS:
+            if line.lstrip().startswith(section):
+                found.setdefault(section, (start, line))
+        start += len(line) + 1
+
+    close = header.end - 2
+    line_start = program.rfind('\n', 0, close) + 1
+    if program[line_start:close].strip():
+        end, before, indent = close, '\n', HEADER_INDENT
+    else:
+        end, before, indent = line_start, '', HEADER_INDENT
+    ret = list()
+    for i, section in enumerate(REQUIRED_HEADER_SECTIONS):
+        if section in found:
+            continue
+        at, prefix, ind = end, before, indent
+        for later in REQUIRED_HEADER_SECTIONS[i+1:]:
+            if later in found:
+                at, line = found[later]
+                prefix = ''
+                ind = line[:len(line) - len(line.lstrip())]
+                break
+        ret.append((at, at, '{}{}{}:\n'.format(prefix, ind, section)))
+        if prefix:
+            # Only the first field added at the end needs a line break.
+            before = ''
+    return ret
+
+
+def blank_line_edits(parsed):
+    """ Return the edits which put two blank lines before each function
+        which two_lines_before_functions reports. """
+    lines = parsed.lines
+    ends = [t.end for t in parsed.tokens if t.kind != 'newline']
+    ret = list()
+    for func in parsed.tree.walk('function'):
+        i = bisect.bisect_right(ends, func.start)
+        prev = ends[i-1] if i else 0
+        if lines.line_number(func.start) - lines.line_number(prev) >= 2:
+            continue
+        gap = parsed.program[prev:func.start]
+        indent = gap[gap.rfind('\n') + 1:]
+        ret.append((prev, func.start, '\n\n\n' + indent))
+    return ret
+
+
+def comment_wrap_edits(parsed):
+    """ Return the edits which wrap the comments of lines over eighty
+        characters, breaking them at spaces.  Only lines whose overflow
+        is in a comment which runs to the end of the line are wrapped, and
+        not within functions, where comments_within_functions already
+        reports the comment (and would report each line of it). """
+    program = parsed.program
+    bodies = [(f.body, f.end) for f in parsed.tree.walk('function')]
+    body_starts = [b[0] for b in bodies]
+
+    def in_function(offset):
+        i = bisect.bisect_right(body_starts, offset) - 1
+        return i >= 0 and offset < bodies[i][1]
+
+    comments = [t for t in parsed.tokens
+                if t.kind in ('comment', 'inline_comment')
+                and not in_function(t.start)]
+    starts = [t.start for t in comments]
+    ret = list()
+    for start, end in parsed.lines.lines():
+        if end - start <= LINE_LENGTH:
+            continue
+        i = bisect.bisect_right(starts, start + LINE_LENGTH) - 1
+        if i < 0 or comments[i].end < end:
+            continue
+        comment = comments[i]
+        line = program[start:end]
+        indent = line[:len(line) - len(line.lstrip())]
+        if comment.kind == 'inline_comment':
+            indent += '// '
+        elif comment.start >= start:
+            indent = ' ' * (comment.start - start) + HEADER_INDENT
+        # The text of the comment, past its opening marker.
+        first = max(comment.start + 2, start)
+        width = 0
+        while width + end - start > LINE_LENGTH:
+            limit = start + LINE_LENGTH - width
+            k = program.rfind(' ', first, limit + 1)
+            if k == -1:
+                break
+            ret.append((k, k + 1, '\n' + indent))
+            start = first = k + 1
+            width = len(indent)
+    return ret
+
+
+# The fix for each rule which can be fixed, by the name of the rule.
+FIXES = collections.OrderedDict([
+    ('file_header', header_edits),
+    ('two_lines_before_functions', blank_line_edits),
+    ('all_lines_eighty_characters', comment_wrap_edits),
+    ])
+
+
+def error_counts(parsed, rules):
+    """ Return a dict of the number of errors each of the named rules
+        finds in parsed. """
+    return dict((name, len(error_list(parsed, [name]))) for name in rules)
+
+
+def fix_program(program, rules=None):
+    """ Return a tuple (fixed, count) of program with the errors of the
+        named rules (by default, all of them) which can be fixed, fixed,
+        and the number of errors fewer it has.  The fixed program is
+        linted again; if any rule finds more errors in it than in
+        program, FixError is raised. """
+    rules = list(rules or RULES)
+    parsed = parse_lines(program)
+    fixes = dict((name, FIXES[name](parsed)) for name in rules
+                 if name in FIXES)
+    if fixes.get('file_header') and 'two_lines_before_functions' in fixes:
+        # A header added at the top already ends in the blank lines a
+        # function right after it needs.
+        inserted = set(start for start, end, _ in fixes['file_header']
+                       if start == end == 0)
+        fixes['two_lines_before_functions'] = [
+            e for e in fixes['two_lines_before_functions']
+            if e[0] not in inserted]
+    edits = [e for name in rules if name in fixes for e in fixes[name]]
+    if not edits:
+        return program, 0
+    fixed = apply_edits(program, edits)
+    before = error_counts(parsed, rules)
+    after = error_counts(parse_lines(fixed), rules)
+    worse = [name for name in rules if after[name] > before[name]]
+    if worse:
+        raise FixError('Fixing would add errors to {}'.format(
+            ', '.join(worse)))
+    return fixed, sum(before.values()) - sum(after.values())
+
+
+def fix_file(filename, rules=None, timeout=None):
+    """ Fix the given file in place.  Return a tuple (filename, count,
+        failure), where count is the number of errors fixed and failure
+        describes why the file could not be fixed, or is None.  The file
+        is replaced atomically, keeping its line endings and mode, and
+        only if it changed.  If fixing takes more than timeout seconds,
+        the file is left as it was. """
+    try:
+        with open(filename, 'rb') as fin:
+            data = fin.read()
+        try:
+            data.decode('utf-8')
+        except UnicodeDecodeError:
+            raise FixError('File is not valid UTF-8')
+        program = decode_program(data)
+        with time_budget(timeout):
+            fixed, count = fix_program(program, rules)
+        if fixed == program:
+            return (filename, 0, None)
+        if b'\r\n' in data:
+            fixed = fixed.replace('\n', '\r\n')
+        directory = os.path.dirname(filename) or os.curdir
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.c')
+        try:
+            with os.fdopen(fd, 'wb') as fout:
+                fout.write(fixed.encode('utf-8'))
+            os.chmod(tmp, os.stat(filename).st_mode & 0o7777)
+            os.replace(tmp, filename)
+        except BaseException:
+            os.remove(tmp)
+            raise
+    except LintTimeout:
+        return (filename, 0, 'Fixing timed out after {} seconds'.format(
+            timeout))
+    except Exception as e:
+        return (filename, 0, '{}: {}'.format(type(e).__name__, e))
+    return (filename, count, None)
+
+
+def fix_files(filenames, jobs=None, rules=None, timeout=None):
+    """ Return a generator of fix_file results for filenames, in the same
+        order, fixed by jobs worker processes (by default, one per core;
+        if jobs is 1, in this process), each within timeout seconds. """
+    fix = functools.partial(fix_file, rules=rules, timeout=timeout)
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    if jobs <= 1 or len(filenames) <= 1:
+        yield from map(fix, filenames)
+        return
+    pool = multiprocessing.Pool(jobs)
+    try:
+        chunksize = max(1, len(filenames) // (jobs * 4))
+        yield from pool.imap(fix, filenames, chunksize)
+    finally:
+        pool.terminate()
@@ -0,0 +1,98 @@
+__package__='rinter.rinter_git'
+"""
+Linting the C files changed between two revisions of a local git
+repository, read straight from its object store: nothing is checked out,
+and every file is read through a single `git cat-file --batch` process.
+"""
+import subprocess
+
+from rinter.rinter_utilities import decode_program
+
+
+class GitError(Exception):
+    pass
+
+
+def git(repo, *args):
+    """ Return the output of the git command args, run in repo. """
+    try:
+        out = subprocess.run(('git', '-C', repo) + args,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             check=True)
+    except FileNotFoundError:
+        raise GitError('git is not installed')
+    except subprocess.CalledProcessError as e:
+        raise GitError(e.stderr.decode('utf-8', 'replace').strip())
+    return out.stdout
+
+
+def split_range(revisions):
+    """ Return the (base, target) of a revision range 'A..B' or 'A...B',
+        where a missing side means HEAD.  A single revision 'A' is the
+        range 'A..HEAD'. """
+    for sep in ('...', '..'):
+        if sep in revisions:
+            base, target = revisions.split(sep, 1)
+            return base or 'HEAD', target or 'HEAD'
+    return revisions, 'HEAD'
+
+
+def changed_files(revisions, repo='.'):
+    """ Return the paths, relative to the top of repo, of the C files
+        which were added or modified in the range revisions. """
+    # A single revision given to git diff is compared with the working
+    # tree, but the programs are read from the target revision.
+    base, target = split_range(revisions)
+    sep = '...' if '...' in revisions else '..'
+    out = git(repo, 'diff', '--name-only', '-z', '--no-renames',
+              '--diff-filter=d', base + sep + target, '--', '*.c')
+    return [p.decode('utf-8', 'surrogateescape')
+            for p in out.split(b'\0') if p]
+
+
+class BlobReader(object):
+    """ Reads objects from repo through one `git cat-file --batch`
+        process, which is kept running until the reader is closed. """
+
+    def __init__(self, repo='.'):
+        try:
+            self.process = subprocess.Popen(
+                ['git', '-C', repo, 'cat-file', '--batch'],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        except FileNotFoundError:
+            raise GitError('git is not installed')
+
+    def read(self, name):
+        """ Return the contents of the object name (as in 'HEAD:a.c'), as
+            bytes. """
+        if b'\n' in name.encode():
+            raise GitError('Bad object name {!r}'.format(name))
+        self.process.stdin.write(name.encode('utf-8', 'surrogateescape')
+                                 + b'\n')
+        self.process.stdin.flush()
+        header = self.process.stdout.readline().split()
+        if len(header) != 3:
+            raise GitError('{} is missing'.format(name))
+        size = int(header[2])
+        data = self.process.stdout.read(size + 1)
+        return data[:size]
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def changed_programs(revisions, repo='.'):
+    """ Return a generator of (path, program) pairs for the C files added
+        or modified in the range revisions, as of its target revision. """
+    target = split_range(revisions)[1]
+    paths = changed_files(revisions, repo)
+    with BlobReader(repo) as reader:
+        for path in paths:
+            yield path, decode_program(reader.read(target + ':' + path))
@@ -0,0 +1,99 @@
+__package__='rinter.rinter_include'
+"""
+Resolution of quoted local #include directives.  Each header is parsed
+once for its prototypes, structs and defines, and the result is shared by
+every program which includes it, until the header changes on disk.
+"""
+import os
+import re
+
+from rinter.rinter_profile import count
+from rinter.rinter_utilities import (LazyPattern, function_name_from_body,
+                                     load_file, macro_definitions,
+                                     parse_lines, parse_structs)
+
+INCLUDE = LazyPattern(r'^[ \t]*#[ \t]*include[ \t]*"([^"\n]+)"', re.M)
+STRUCT_NAME = LazyPattern(r'struct\s+(\w+)')
+
+
+class Header(object):
+    """ The declarations of a local header: the names of the functions it
+        prototypes, of the structs it defines and of its macros, and the
+        headers it includes in turn.  stamp is the (modification time,
+        size) of the file it was parsed from. """
+
+    def __init__(self, path, program):
+        self.path = path
+        self.stamp = None
+        parsed = parse_lines(program)
+        self.prototypes = frozenset(function_name_from_body(p.group())
+                                    for p in parsed.prototypes)
+        # A struct from a #define starts with 'define', so it is searched.
+        names = (STRUCT_NAME.search(s.group()) for s in parse_structs(program))
+        self.structs = frozenset(m.group(1) for m in names if m)
+        self.defines = frozenset(name.group()
+                                 for name in macro_definitions(parsed.tokens))
+        self.includes = included_names(program)
+
+
+class HeaderCache(object):
+    """ Headers parsed so far, keyed by path.  A header is parsed again
+        only when its modification time or size changes. """
+
+    def __init__(self):
+        self.headers = dict()
+
+    def get(self, path):
+        """ Return the Header at path, or None if there is none. """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        stamp = (st.st_mtime_ns, st.st_size)
+        header = self.headers.get(path)
+        if header is not None and header.stamp == stamp:
+            count('header cache hit')
+            return header
+        header = self.headers[path] = Header(path, load_file(path))
+        header.stamp = stamp
+        return header
+
+
+HEADER_CACHE = HeaderCache()
+
+
+def included_names(program):
+    """ Return the names given to each quoted #include in program. """
+    return [m.group(1) for m in INCLUDE.finditer(program)]
+
+
+def resolve_includes(program, include_path, cache=None):
+    """ Return the list of Headers which program includes, directly or
+        through other headers, with quotes.  Each name is looked for in
+        the directories of include_path in order; names included by a
+        header are looked for next to it first.  Names which are not
+        found are left out. """
+    cache = HEADER_CACHE if cache is None else cache
+    ret = list()
+    seen = set()
+    pending = [(name, include_path) for name in included_names(program)]
+    while pending:
+        name, directories = pending.pop(0)
+        header = None
+        for directory in directories:
+            path = os.path.normpath(os.path.join(directory, name))
+            header = cache.get(path)
+            if header is not None:
+                break
+        if header is None or path in seen:
+            continue
+        seen.add(path)
+        ret.append(header)
+        here = [os.path.dirname(path)] + list(include_path)
+        pending.extend((n, here) for n in header.includes)
+    return ret
+
+
+def header_stamps(headers):
+    """ Return a string which changes whenever one of headers does. """
+    return ';'.join('{}:{}:{}'.format(h.path, *h.stamp) for h in headers)
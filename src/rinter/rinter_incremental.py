@@ -0,0 +1,171 @@
+__package__='rinter.rinter_incremental'
+"""
+Incremental linting: a program is split into contexts between its
+top-level blocks, as chunked linting splits it, and the errors found in
+each context are cached, so that relinting a program after an edit only
+tokenizes, parses and lints the contexts which changed.  Where the
+contexts are is worked out again only around the edit, from the
+contexts of a program linted before.
+"""
+import collections
+import hashlib
+
+from rinter import __version__
+from rinter.rinter import RULES, error_list
+from rinter.rinter_chunk import FIRST_CHUNK_RULES, chunk_boundaries
+from rinter.rinter_chunk import shift_error
+from rinter.rinter_include import header_stamps
+from rinter.rinter_profile import count
+from rinter.rinter_utilities import ParsedProgram
+
+DEFAULT_MAX_ENTRIES = 4096
+DEFAULT_MAX_PROGRAMS = 16
+
+
+class FunctionCache(object):
+    """ An in-memory cache of the errors found in single contexts, which
+        holds at most max_entries contexts, evicting the least recently
+        used; and of where the contexts of the last max_programs programs
+        begin. """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES,
+                 max_programs=DEFAULT_MAX_PROGRAMS):
+        self.max_entries = max_entries
+        self.max_programs = max_programs
+        self.entries = collections.OrderedDict()
+        self.programs = collections.OrderedDict()
+
+    def key(self, context, rules, headers=''):
+        """ Return the cache key for running the named rules over context,
+            in a program which includes the given header_stamps. """
+        h = hashlib.sha256()
+        h.update(__version__.encode())
+        h.update(b'\0')
+        h.update(','.join(rules).encode())
+        h.update(b'\0')
+        h.update(headers.encode('utf-8', 'surrogatepass'))
+        h.update(b'\0')
+        h.update(context.encode('utf-8', 'surrogatepass'))
+        return h.hexdigest()
+
+    def get(self, key):
+        errors = self.entries.get(key)
+        if errors is not None:
+            self.entries.move_to_end(key)
+        return errors
+
+    def put(self, key, errors):
+        self.entries[key] = errors
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def boundaries(self, program):
+        """ Return the list of offsets at which the contexts of program
+            begin, but for the first, reusing those of the program seen
+            before which is the most like it. """
+        found = self.programs.get(program)
+        if found is None:
+            best = None
+            for old, bounds in self.programs.items():
+                prefix, suffix = shared_ends(old, program)
+                if best is None or prefix + suffix > best[0]:
+                    best = (prefix + suffix, old, bounds, prefix, suffix)
+            if best is None:
+                found = list(chunk_boundaries(program, 1))
+            else:
+                found = rescan_boundaries(program, *best[1:])
+            self.programs[program] = found
+        self.programs.move_to_end(program)
+        while len(self.programs) > self.max_programs:
+            self.programs.popitem(last=False)
+        return found
+
+
+FUNCTION_CACHE = FunctionCache()
+
+
+def shared_ends(old, new):
+    """ Return the lengths of the longest prefix and, of what is left, the
+        longest suffix which old and new have in common.  Each is found by
+        bisection over slices, so the characters are compared in C. """
+    most = min(len(old), len(new))
+    lo, hi = 0, most
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if old[lo:mid] == new[lo:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    prefix = lo
+    lo, hi = 0, most - prefix
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if old[len(old)-mid:len(old)-lo] == new[len(new)-mid:len(new)-lo]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return prefix, lo
+
+
+def rescan_boundaries(program, old, bounds, prefix, suffix):
+    """ Return the context boundaries of program, given those, bounds, of
+        old, with which it shares prefix characters at the start and
+        suffix at the end.  The boundaries before the edit are kept, the
+        program is scanned from the last of them until a boundary lines up
+        with one of old past the edit, and the rest are shifted. """
+    # A boundary is kept only if the newline after it is unchanged.
+    kept = [b for b in bounds if b < prefix]
+    start = kept[-1] if kept else 0
+    shift = len(program) - len(old)
+    edited = len(program) - suffix
+    later = set(b for b in bounds if b >= len(old) - suffix)
+    for b in chunk_boundaries(program, 1, start):
+        if b >= edited and b - shift in later:
+            kept.extend(x + shift for x in bounds if x >= b - shift)
+            break
+        kept.append(b)
+    return kept
+
+
+def context_errors(context, rules, included=None):
+    """ Return the errors the named rules find in context, located in
+        it.  If given, included is the list of Headers the program
+        includes. """
+    parsed = ParsedProgram(context)
+    if included is not None:
+        parsed.facts['included'] = included
+    return error_list(parsed, rules)
+
+
+def incremental_error_list(program, rules=None, cache=None):
+    """ Return the errors error_list(program, rules) would, answering
+        them from cache (by default, FUNCTION_CACHE) for every context it
+        has seen before.  The order of the errors may differ. """
+    cache = FUNCTION_CACHE if cache is None else cache
+    included = None
+    if isinstance(program, ParsedProgram):
+        if program.include_path is not None:
+            included = program.included
+        program = program.program
+    rules = list(rules or RULES)
+    later = [r for r in rules if r not in FIRST_CHUNK_RULES]
+    headers = header_stamps(included) if included else ''
+    ret = list()
+    start = 0
+    line = column = 1
+    for end in cache.boundaries(program) + [len(program)]:
+        context = program[start:end]
+        names = rules if start == 0 else later
+        key = cache.key(context, names, headers)
+        found = cache.get(key)
+        if found is None:
+            found = context_errors(context, names, included)
+            cache.put(key, found)
+        else:
+            count('function cache hit')
+        ret.extend(shift_error(e, line, column) for e in found)
+        line += program.count('\n', start, end)
+        column = end - program.rfind('\n', 0, end)
+        start = end
+    return ret
@@ -0,0 +1,116 @@
+__package__='rinter.rinter_profile'
+"""
+Instrumentation of rinter: time spent in each check, the size of its
+input, and how often the parsing helpers are called.
+
+Profiling is off unless a Profiler is made active, either with the
+profiling() context manager or the --profile option, and costs a single
+global lookup per call while it is off.
+"""
+import contextlib
+import functools
+import time
+
+_active = None
+
+
+class Profiler(object):
+    """ Accumulated measurements of one or more runs of rinter. """
+
+    def __init__(self):
+        self.checks = dict()
+        self.calls = dict()
+
+    def record(self, name, elapsed, size):
+        """ Record that the check name took elapsed seconds on a program
+            of size characters. """
+        stats = self.checks.setdefault(name, dict(calls=0, time=0.0, size=0))
+        stats['calls'] += 1
+        stats['time'] += elapsed
+        stats['size'] += size
+
+    def count(self, name):
+        """ Record a call of the helper name. """
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def merge(self, other):
+        """ Add the measurements of other (a Profiler or the result of
+            as_dict) to these. """
+        if isinstance(other, Profiler):
+            other = other.as_dict()
+        for name, stats in other['checks'].items():
+            mine = self.checks.setdefault(name,
+                                          dict(calls=0, time=0.0, size=0))
+            for k in mine:
+                mine[k] += stats[k]
+        for name, calls in other['calls'].items():
+            self.calls[name] = self.calls.get(name, 0) + calls
+
+    def as_dict(self):
+        return dict(checks=self.checks, calls=self.calls)
+
+    def json(self):
+        import json
+        return json.dumps(self.as_dict(), indent=2, sort_keys=True)
+
+    def table(self):
+        """ Return the measurements as a table, slowest check first. """
+        lines = ['{:<36} {:>8} {:>10} {:>10} {:>12}'.format(
+            'check', 'calls', 'total (s)', 'mean (ms)', 'chars')]
+        checks = sorted(self.checks.items(), key=lambda x: -x[1]['time'])
+        for name, stats in checks:
+            lines.append('{:<36} {:>8} {:>10.4f} {:>10.3f} {:>12}'.format(
+                name, stats['calls'], stats['time'],
+                1000 * stats['time'] / max(stats['calls'], 1),
+                stats['size']))
+        lines.append('')
+        lines.append('{:<36} {:>8}'.format('helper', 'calls'))
+        for name, calls in sorted(self.calls.items(), key=lambda x: -x[1]):
+            lines.append('{:<36} {:>8}'.format(name, calls))
+        return '\n'.join(lines)
+
+
+@contextlib.contextmanager
+def profiling(profiler):
+    """ Make profiler the active Profiler in the body. """
+    global _active
+    previous = _active
+    _active = profiler
+    try:
+        yield profiler
+    finally:
+        _active = previous
+
+
+@contextlib.contextmanager
+def timed(name, size):
+    """ Record the time taken by the body as a run of the check name on a
+        program of size characters, if a Profiler is active. """
+    profiler = _active
+    if profiler is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.record(name, time.perf_counter() - start, size)
+
+
+def count(name):
+    """ Record a call of the helper name, if a Profiler is active. """
+    if _active is not None:
+        _active.count(name)
+
+
+def counted(function):
+    """ Decorator which counts the calls of function while a Profiler is
+        active. """
+    name = function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if _active is not None:
+            _active.count(name)
+        return function(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,246 @@
+__package__='rinter.rinter_server'
+"""
+A long running lint server on a local Unix socket, and a thin client for it.
+
+The server keeps the compiled patterns, the result cache and a pool of
+workers alive between requests, so that editors and hooks which lint
+again and again only pay for the lint itself.  Its workers lint
+incrementally, so relinting an edited file only parses and lints the
+top-level blocks around the edit.  Requests and responses are JSON
+objects, one per line.  A request holds
+
+    cwd       the directory relative paths are resolved against
+    paths     files, directories or glob patterns to lint
+    programs  [name, content] pairs to lint without reading a file
+    select    names of the only rules to run
+    ignore    names of rules not to run
+
+and is answered by one line {"file", "errors", "failure"} per program,
+in order, then {"done": true}; or by {"error": message} if the request
+is malformed.  The request {"shutdown": true} stops the server.
+
+This module only imports the linter itself when it serves or falls back
+to linting in process, so that starting the client stays cheap.
+"""
+import json
+import os
+import socket
+import sys
+import tempfile
+
+DEFAULT_SOCKET = os.path.join(
+    os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir(),
+    'rinter-{}.sock'.format(os.getuid() if hasattr(os, 'getuid') else 0))
+
+
+def resolve_request(request):
+    """ Return the list of (name, source) pairs named by request, where
+        name is how the program is reported and source is what is passed
+        to lint_files: a path, or a (name, program) pair.  The C files in
+        archives are read here, and ArchiveError raised if one cannot
+        be. """
+    from rinter.rinter_batch import expand_paths, is_archive
+    cwd = request.get('cwd') or os.getcwd()
+    ret = list()
+    for path in request.get('paths', []):
+        prefix = '' if os.path.isabs(path) else os.path.join(cwd, '')
+        for filename in expand_paths([os.path.join(cwd, path)]):
+            name = filename
+            if prefix and filename.startswith(prefix):
+                name = filename[len(prefix):]
+            if not is_archive(filename):
+                ret.append((name, filename))
+                continue
+            from rinter.rinter_archive import archive_programs
+            for member, program in archive_programs(filename):
+                member = name + member[len(filename):]
+                ret.append((member, (member, program)))
+    for name, program in request.get('programs', []):
+        ret.append((name, (name, program)))
+    return ret
+
+
+class LintServer(object):
+    """ Answers lint requests on the Unix socket at address, linting with
+        jobs workers (by default, one per core) and answering from cache
+        when it is given. """
+
+    def __init__(self, address=DEFAULT_SOCKET, jobs=None, cache=None,
+                 timeout=None):
+        from rinter.rinter_batch import lint_files
+        self.address = address
+        self.jobs = jobs or os.cpu_count() or 1
+        self.cache = cache
+        self.timeout = timeout
+        self.pool = None
+        self.running = False
+        self.lint_files = lint_files
+
+    def bind(self):
+        """ Create the socket, replacing one left behind by a server which
+            is no longer running. """
+        if os.path.exists(self.address):
+            try:
+                with socket.socket(socket.AF_UNIX) as s:
+                    s.connect(self.address)
+            except ConnectionRefusedError:
+                os.unlink(self.address)
+            else:
+                raise OSError('A server is already running on {}'.format(
+                    self.address))
+        self.socket = socket.socket(socket.AF_UNIX)
+        self.socket.bind(self.address)
+        self.socket.listen()
+
+    def serve_forever(self):
+        """ Answer requests until a shutdown request arrives. """
+        import multiprocessing
+        self.bind()
+        if self.jobs > 1:
+            self.pool = multiprocessing.Pool(self.jobs)
+        self.running = True
+        try:
+            while self.running:
+                conn, _ = self.socket.accept()
+                try:
+                    self.answer(conn)
+                except (OSError, ValueError):
+                    pass
+                finally:
+                    conn.close()
+        finally:
+            self.close()
+
+    def answer(self, conn):
+        """ Answer every request sent on the connection conn. """
+        with conn.makefile('rw', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    request = json.loads(line)
+                except ValueError as e:
+                    responses = [{'error': 'Bad request: {}'.format(e)}]
+                else:
+                    responses = self.handle(request)
+                for response in responses:
+                    f.write(json.dumps(response) + '\n')
+                f.flush()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+        self.socket.close()
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+
+    def handle(self, request):
+        """ Return a generator of the responses to request. """
+        from rinter.rinter import select_rules
+        from rinter.rinter_archive import ArchiveError
+        if not isinstance(request, dict):
+            yield {'error': 'Bad request: expected a JSON object'}
+            return
+        if request.get('shutdown'):
+            self.running = False
+            yield {'done': True}
+            return
+        try:
+            rules = select_rules(request.get('select'), request.get('ignore'))
+            sources = resolve_request(request)
+        except (ValueError, TypeError, ArchiveError) as e:
+            yield {'error': str(e)}
+            return
+        results = self.lint_files([s for _, s in sources], self.jobs,
+                                  self.cache, self.timeout, rules=rules,
+                                  pool=self.pool, incremental=True)
+        for (name, _), (_, errors, failure) in zip(sources, results):
+            yield {'file': name, 'errors': errors, 'failure': failure}
+        yield {'done': True}
+
+
+def request(message, address=DEFAULT_SOCKET):
+    """ Send message to the server at address, and return a generator of
+        its responses up to the last one. """
+    with socket.socket(socket.AF_UNIX) as s:
+        s.connect(address)
+        with s.makefile('rw', encoding='utf-8') as f:
+            f.write(json.dumps(message) + '\n')
+            f.flush()
+            for line in f:
+                response = json.loads(line)
+                yield response
+                if 'done' in response or 'error' in response:
+                    return
+
+
+def _serve_main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Lint server for CPS360.')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET,
+                        help='Path of the Unix socket to listen on')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Number of worker processes (default: one per '
+                             'core)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Do not use or update the result cache')
+    parser.add_argument('--cache-dir', default=None,
+                        help='Directory of the result cache')
+    parser.add_argument('--timeout', type=float, default=10,
+                        help='Seconds to spend linting one file before '
+                             'giving up on it (default: 10, 0 for no limit)')
+    args = parser.parse_args()
+
+    from rinter.rinter_cache import DEFAULT_CACHE_DIR, ResultCache
+    cache = None
+    if not args.no_cache:
+        cache = ResultCache(args.cache_dir or DEFAULT_CACHE_DIR)
+    try:
+        LintServer(args.socket, args.jobs, cache, args.timeout).serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def _client_main(argv=None):
+    """ Lint the paths in argv on the server, or in this process if no
+        server is running.  Accepts --socket PATH, --select RULES and
+        --ignore RULES; '-' lints stdin. """
+    argv = sys.argv[1:] if argv is None else argv
+    options = {'--socket': DEFAULT_SOCKET, '--select': None, '--ignore': None}
+    message = {'cwd': os.getcwd(), 'paths': [], 'programs': []}
+    args = iter(argv)
+    for arg in args:
+        if arg in options:
+            options[arg] = next(args, None)
+        elif arg == '-':
+            message['programs'].append(['-', sys.stdin.read()])
+        else:
+            message['paths'].append(arg)
+    for option in ('--select', '--ignore'):
+        if options[option]:
+            message[option[2:]] = options[option].split(',')
+
+    try:
+        responses = list(request(message, options['--socket']))
+    except (FileNotFoundError, ConnectionRefusedError):
+        responses = _lint_in_process(message)
+    reported = 0
+    for response in responses:
+        if 'error' in response:
+            print('rinter: error: {}'.format(response['error']),
+                  file=sys.stderr)
+            return 2
+        if response.get('failure') is not None:
+            reported += 1
+            print('{}: could not be linted: {}'.format(response['file'],
+                                                      response['failure']))
+        for error in response.get('errors', []):
+            reported += 1
+            print('{}:{}'.format(response['file'], error))
+    return 1 if reported else 0
+
+
+def _lint_in_process(message):
+    """ Return a generator of the responses the server would give to
+        message, linting in this process. """
+    from rinter.rinter_cache import ResultCache
+    return LintServer(cache=ResultCache()).handle(message)
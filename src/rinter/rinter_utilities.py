@@ -3,34 +3,96 @@ r"""
 Utilities for rinter.
 """
 
+import bisect
+import functools
+import mmap
 import re
-
-BLOCK = '\{[^\}]*\}'
-PAREN = '\([^\)]*\)'
-COMMENT = re.compile('\/\*+[\s\S]*?\*\/')
-INLINE_COMMENT = re.compile('\/\/[^\n]*')
-FUNCTION_START = re.compile('\w+\s+\w+' + PAREN + '\s*\{')
-FUNCTION_PROTOTYPE = re.compile('\w+\s+\w+' + PAREN + ';')
+import sys
+
+from rinter.rinter_profile import count, counted
+
+
+class LazyPattern(object):
+    """ A regular expression which is compiled the first time it is used,
+        so that importing rinter does not pay for patterns it never uses.
+        It stands in for the compiled pattern: call its methods (match,
+        finditer, findall, ...) rather than the functions of re. """
+    __slots__ = ('pattern', 'flags', '_compiled')
+
+    def __init__(self, pattern, flags=0):
+        self.pattern = pattern
+        self.flags = flags
+        self._compiled = None
+
+    def compile(self):
+        """ Return the compiled pattern. """
+        if self._compiled is None:
+            count('LazyPattern.compile')
+            self._compiled = re.compile(self.pattern, self.flags)
+        return self._compiled
+
+    def __getattr__(self, name):
+        return getattr(self.compile(), name)
+
+
+# Patterns which scan ahead for a closing character stop at the next brace
+# or statement, and at most STATEMENT characters, so that every attempt to
+# match them is bounded even when the closing character never comes.
+STATEMENT = '{0,400}'
+BLOCK = '\{[^\{\}]*\}'
+PAREN = '\([^\)\;\{\}]' + STATEMENT + '\)'
+COMMENT = LazyPattern('\/\*+[\s\S]*?\*\/')
+INLINE_COMMENT = LazyPattern('\/\/[^\n]*')
+# A function only starts at the start of a word, so that a long word is not
+# rescanned from each of its characters.
+FUNCTION_START = LazyPattern('(?<!\w)\w+\s+\w+' + PAREN + '\s*\{')
+FUNCTION_PROTOTYPE = LazyPattern('(?<!\w)\w+\s+\w+' + PAREN + ';')
 OPERATORS = '\+\-\/\*\(\)\%\~\|\^\&\<\>\?\:'
-VARIABLE_DECLARATION = re.compile('\w+[\*\s]+\w+[\,\s\w]{0,80}=?[\w\s\d' +
-    OPERATORS + ']{0,100};')
-WHITESPACE = re.compile('\s?')
-STRUCT = re.compile('struct\s+\w+\s?' + BLOCK + '[^\;]*\;')
-DEFINE_STRUCT = re.compile('define\s+' + STRUCT.pattern)
-IF_WITH_CURL = re.compile('if[\s\w]*' + PAREN + '[\s]*\{')
-IF_SANS_CURL = re.compile('if[\s]*' + PAREN + '[^\{]*?\;\s*?')
-ELSE_IF_WITH_CURL = re.compile('else\s+\{')
-ELSE_IF_SANS_CURL = re.compile('else\s+' + IF_SANS_CURL.pattern + '\s?')
-ELSE_WITH_CURL = re.compile('else\s?\{')
-ELSE_SANS_CURL = re.compile('else\s+[^\;]*\;')
-FOR = re.compile('for\s+' + PAREN + '\s?{')
+# A declaration may only start where it could not extend further left, and
+# its parts match disjoint characters, so no character is rescanned.
+VARIABLE_DECLARATION = LazyPattern('(?<![\w\s\,\*])\s*(\w+[\*\s]+\w[\w\s\,]*' +
+    '(?:[\=' + OPERATORS + '][\w\s' + OPERATORS + ']*)?;)')
+WHITESPACE = LazyPattern('\s?')
+STRUCT = LazyPattern('struct\s+\w+\s?' + BLOCK + '[^\;]' + STATEMENT + '\;')
+DEFINE_STRUCT = LazyPattern('define\s+' + STRUCT.pattern)
+TOKEN = LazyPattern(
+    r'(?P<comment>/\*[\s\S]*?\*/|/\*[\s\S]*)'
+    r'|(?P<inline_comment>//[^\n]*)'
+    r'|(?P<string>"(?:[^"\\\n]|\\[\s\S])*"?)'
+    r"|(?P<char>'(?:[^'\\\n]|\\[\s\S])*'?)"
+    r'|(?P<identifier>\w+)'
+    r'|(?P<open_brace>\{)'
+    r'|(?P<close_brace>\})'
+    r'|(?P<open_paren>\()'
+    r'|(?P<close_paren>\))'
+    r'|(?P<semicolon>;)'
+    r'|(?P<newline>\n)'
+    r'|(?P<other>\S)')
+KEYWORDS = frozenset([
+    'if', 'else', 'for', 'while', 'do', 'switch', 'case', 'return',
+    'sizeof', 'goto', 'break', 'continue', 'default',
+    ])
+PARAMETER_STOP = frozenset([
+    'close_paren', 'open_brace', 'close_brace', 'semicolon',
+    ])
+CONTROL_KEYWORDS = frozenset(['if', 'for', 'while', 'switch'])
+STATEMENT_END = frozenset(['semicolon', 'open_brace', 'close_brace'])
+COMMENT_KINDS = frozenset(['comment', 'inline_comment'])
+LABEL_KEYWORDS = frozenset(['case', 'default'])
+BLOCK_TOKENS = frozenset(['open_brace', 'close_brace', 'semicolon'])
+BLOCK_KEYWORDS = frozenset(['if', 'else', 'for', 'while', 'do', 'switch',
+                            'struct'])
 
 # regex from pep8:
 #   https://github.com/pycqa/pep8
-EXTRANEOUS_WHITESPACE_REGEX = re.compile(r'[[({] | []}),;:]')
+EXTRANEOUS_WHITESPACE_REGEX = LazyPattern(r'[[({] | []}),;:]')
 
 
 class Custom_SRE_Match(object):
+    """ A match which holds its own copy of its text.  Matches found by
+        rinter are Spans, which do not copy; this is kept for matches built
+        from text alone. """
+    __slots__ = ('g', 's')
 
     def __init__(self, g=None, s=None):
         self.g = g
@@ -43,70 +105,654 @@ class Custom_SRE_Match(object):
         return self.s
 
 
-def load_file(filename):
-    """ Loads a file in the format necessary for parsing """
-    with open(filename, 'r') as fin:
-        lines = fin.readlines()
-    return ''.join(lines)
+class Span(object):
+    """ The span from start to end of source.  Only the offsets and a
+        reference to source are kept; the text is sliced from source when
+        group is called. """
+    __slots__ = ('source', 'start', 'end')
 
+    def __init__(self, source, start, end):
+        self.source = source
+        self.start = start
+        self.end = end
 
-def parse_lines(program):
-    """ Parses the given program into functions, main, comments, spaces,
-    globals, includes, and defines """
-    parsed = dict()
+    def group(self):
+        return self.source[self.start:self.end]
+
+    def span(self):
+        return (self.start, self.end)
+
+
+class Token(Span):
+    """ A lexical token: its kind (one of the group names in TOKEN) and its
+        span in the program it was read from. """
+    __slots__ = ('kind',)
+
+    def __init__(self, kind, source, start, end):
+        self.kind = kind
+        self.source = source
+        self.start = start
+        self.end = end
+
+
+class Block(Span):
+    """ A node of the block tree of a program.  kind is one of 'program',
+        'function', 'struct', 'if', 'else', 'for', 'while', 'do', 'switch'
+        or 'block' (any other pair of braces).  The span of an if takes in
+        its else, which is one of its children; that of a function takes in
+        its comment.  name is the name of a function or struct, or None,
+        and body is the offset at which the body starts: its open brace, or
+        the first token of its single statement. """
+    __slots__ = ('kind', 'name', 'body', 'children')
+
+    def __init__(self, kind, source, start, end=None, name=None, body=None):
+        self.kind = kind
+        self.source = source
+        self.start = start
+        self.end = end
+        self.name = name
+        self.body = body
+        self.children = list()
+
+    def walk(self, *kinds):
+        """ Return a generator of the Blocks within this one, in the order
+            in which they start, which are of one of kinds (or of any kind,
+            if none are given). """
+        stack = list(reversed(self.children))
+        while stack:
+            node = stack.pop()
+            if not kinds or node.kind in kinds:
+                yield node
+            stack.extend(reversed(node.children))
+
+
+def join_spans(first, second):
+    """ Return a match from the start of first to the end of second, which
+        starts where first ends.  If both are Spans of the same source, no
+        text is copied. """
+    if (isinstance(first, Span) and isinstance(second, Span)
+            and first.source is second.source):
+        return Span(first.source, first.start, second.end)
+    return Custom_SRE_Match(first.group() + second.group(),
+                            (first.span()[0], second.span()[1]))
+
+
+class SpanIndex(object):
+    """ An index of matches by the offsets at which they start and end.
+        Where several matches share an offset, the first one is kept. """
+
+    def __init__(self, matches):
+        self.starts = dict()
+        self.ends = dict()
+        for m in matches:
+            self.starts.setdefault(m.span()[0], m)
+            self.ends.setdefault(m.span()[1], m)
+
+
+class Mask(object):
+    """ A view of a program with some ranges (inclusive of both ends)
+        blanked out with spaces.  Ranges may be added at any time; the
+        masked text is built in a single pass the first time it is needed
+        after a change, rather than once per range. """
+
+    def __init__(self, line, ranges=()):
+        self.line = line
+        self.ranges = list(ranges)
+        self._text = None
+
+    def exclude(self, ranges):
+        """ Blank out the given ranges as well. """
+        self.ranges.extend(ranges)
+        self._text = None
+
+    def text(self):
+        """ Return the masked program. """
+        if self._text is not None:
+            return self._text
+        count('Mask.text')
+        pieces = list()
+        prev = 0
+        for a, b in sorted(self.ranges):
+            a = max(a, prev)
+            b = min(b, len(self.line) - 1)
+            if b < a:
+                continue
+            pieces.append(self.line[prev:a])
+            pieces.append(' ' * (b - a + 1))
+            prev = b + 1
+        pieces.append(self.line[prev:])
+        self._text = ''.join(pieces)
+        return self._text
+
+    def finditer(self, pattern):
+        """ Return an iterator of the matches of pattern in the masked
+            program. """
+        if isinstance(pattern, LazyPattern):
+            pattern = pattern.compile()
+        return re.finditer(pattern, self.text())
+
+
+class BraceTable(object):
+    """ The pairing of every brace in a program, computed in a single pass
+        over its tokens, so that comments and string literals are skipped.
+        ends maps the offset of each '{' to the offset just past its
+        matching '}' (or to the end of the program, if it has none), and
+        unmatched lists the offsets of braces without a partner. """
+
+    def __init__(self, line, tokens=None):
+        count('BraceTable')
+        if tokens is None:
+            tokens = tokenize(line)
+        self.ends = dict()
+        self.unmatched = list()
+        stack = list()
+        for t in tokens:
+            if t.kind == 'open_brace':
+                stack.append(t.span()[0])
+            elif t.kind == 'close_brace':
+                if stack:
+                    self.ends[stack.pop()] = t.span()[1]
+                else:
+                    self.unmatched.append(t.span()[0])
+        for start in stack:
+            self.ends[start] = len(line)
+        self.unmatched.extend(stack)
+        self.unmatched.sort()
+
+
+class LineIndex(object):
+    """ The offset at which each line of a program starts, found in a
+        single pass, so that offsets can be turned into line and column
+        numbers with a binary search. """
+
+    def __init__(self, line):
+        count('LineIndex')
+        self.length = len(line)
+        self.starts = [0]
+        i = line.find('\n')
+        while i != -1:
+            self.starts.append(i + 1)
+            i = line.find('\n', i + 1)
+
+    def line_number(self, offset):
+        """ Return the (1-based) number of the line containing offset. """
+        return bisect.bisect_right(self.starts, offset)
+
+    def location(self, offset):
+        """ Return the (1-based) line and column of offset. """
+        n = self.line_number(offset)
+        return (n, offset - self.starts[n-1] + 1)
+
+    def lines(self):
+        """ Return a generator of the (start, end) span of each line, not
+            including its newline. """
+        for i in range(len(self.starts)):
+            if i + 1 < len(self.starts):
+                yield (self.starts[i], self.starts[i+1] - 1)
+            elif self.starts[i] < self.length:
+                yield (self.starts[i], self.length)
+
+    def format(self, offset, message):
+        """ Return message prefixed with the location of offset. """
+        return '{}:{}: {}'.format(*self.location(offset), message)
+
+
+def location_key(error):
+    """ Return a key which sorts errors formatted by LineIndex.format by
+        their location, and then by their message. """
+    parts = error.split(':', 2)
+    try:
+        return (int(parts[0]), int(parts[1]), parts[2])
+    except (IndexError, ValueError):
+        return (0, 0, error)
+
+
+@counted
+def tokenize(line):
+    """ Split the program into a list of Tokens in a single pass.  Every
+        character which is not whitespace belongs to exactly one token, so
+        braces and comment markers inside of strings are never mistaken for
+        code. """
+    return [Token(m.lastgroup, line, m.start(), m.end())
+            for m in TOKEN.finditer(line)]
 
-    parsed['comments'] = [ a for a in re.finditer(COMMENT, program)]
-    parsed['prototypes'] = [a for a in re.finditer(FUNCTION_PROTOTYPE, program)]
-    parsed['conditionals'] = parse_ifs(program)
-    parsed['functions'] = parse_functions_with_bodies(f)
 
-    return parsed
+def load_file(filename):
+    """ Loads a file in the format necessary for parsing.  The file is
+        memory-mapped (or, if filename is '-', stdin is read in a single
+        call) and decoded once, so only the decoded text is kept. """
+    if filename == '-':
+        return decode_program(sys.stdin.buffer.read())
+    with open(filename, 'rb') as fin:
+        try:
+            data = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # Empty files and pipes cannot be mapped.
+            return decode_program(fin.read())
+        with data:
+            return decode_program(data)
+
+
+def decode_program(data):
+    """ Decode the bytes-like data of a program, with line endings
+        normalized to '\\n' as a file opened in text mode would have. """
+    program = str(data, 'utf-8', 'replace')
+    if '\r' in program:
+        program = program.replace('\r\n', '\n').replace('\r', '\n')
+    return program
+
+
+def fact(function):
+    """ Decorator for the facts of a ParsedProgram: a fact is computed the
+        first time it is asked for, and then kept. """
+    name = function.__name__
+
+    @functools.wraps(function)
+    def getter(self):
+        try:
+            return self.facts[name]
+        except KeyError:
+            value = self.facts[name] = function(self)
+            return value
+    return property(getter)
+
+
+class ParsedProgram(object):
+    """ The facts about a program which the rules are built on.  Each is
+        computed lazily and memoized, so a caller pays only for the facts
+        it uses, and each at most once.  Facts may also be read by name,
+        as in parsed['functions'].  If include_path is given, quoted
+        #includes are looked for in its directories. """
+
+    def __init__(self, program, include_path=None):
+        self.program = program
+        self.include_path = include_path
+        self.facts = dict()
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+    def has(self, name):
+        """ Return True if the fact name has already been computed. """
+        return name in self.facts
+
+    @fact
+    def tokens(self):
+        return tokenize(self.program)
+
+    @fact
+    def lines(self):
+        return LineIndex(self.program)
+
+    @fact
+    def braces(self):
+        return BraceTable(self.program, self.tokens)
+
+    @fact
+    def headers(self):
+        """ The (type, name, open brace) tokens of each function. """
+        return function_headers(self.tokens)
+
+    @fact
+    def functions(self):
+        """ The (function, name, block) of each function. """
+        return parse_functions(self.program, self.tokens, self.braces,
+                               self.headers)
+
+    @fact
+    def blocks(self):
+        """ The span of the body of each function. """
+        return [block for _, _, block in self.functions]
+
+    @fact
+    def header(self):
+        """ The Token of the first block comment, or None. """
+        for token in self.tokens:
+            if token.kind == 'comment':
+                return token
+        return None
+
+    @fact
+    def comments(self):
+        """ The span of each block and inline comment. """
+        return [t.span() for t in self.tokens
+                if t.kind in ('comment', 'inline_comment')]
+
+    @fact
+    def prototypes(self):
+        """ The function prototypes outside of any function, comment or
+            literal.  A match which spans a blanked out function joins
+            words from either side of it, so it is left out. """
+        spans = [f.span() for f, _, _ in self.functions]
+        mask = Mask(self.program, spans)
+        mask.exclude((t.start, t.end - 1) for t in self.tokens
+                     if t.kind in ('comment', 'inline_comment', 'string',
+                                   'char'))
+        starts = [a for a, _ in spans]
+        return [m for m in mask.finditer(FUNCTION_PROTOTYPE)
+                if bisect.bisect_left(starts, m.start())
+                == bisect.bisect_left(starts, m.end())]
+
+    @fact
+    def tree(self):
+        """ The Block at the root of the block tree. """
+        return block_tree(self.program, self.tokens, self.braces,
+                          self.functions)
+
+    @fact
+    def conditionals(self):
+        return parse_ifs(self.program, self.tree)
+
+    @fact
+    def included(self):
+        """ The Headers the program includes, if include_path was given. """
+        if self.include_path is None:
+            return []
+        from rinter.rinter_include import resolve_includes
+        return resolve_includes(self.program, self.include_path)
+
+    @fact
+    def loops(self):
+        return parse_fors(self.program, tree=self.tree)
+
+    @fact
+    def indentation(self):
+        """ The expected indentation of each line. """
+        return indentation_levels(self.tokens)
+
+    @fact
+    def declarations(self):
+        """ The (block, name) of each variable declared in a function. """
+        return variable_declarations(self.tokens, self.headers)
+
+    @fact
+    def macros(self):
+        """ The name Token of each object-like #define. """
+        return macro_definitions(self.tokens)
+
+
+def parse_lines(program):
+    """ Parses the given program into a ParsedProgram, whose facts
+    (tokens, lines, functions, comments, prototypes, conditionals, ...)
+    are computed as they are needed. """
+    if isinstance(program, ParsedProgram):
+        return program
+    return ParsedProgram(program)
 
 
-def find_function_or_comment(line):
+@counted
+def find_function_or_comment(line, tokens=None, headers=None):
     """ Find instances of either comments and functions or just functions.
-        Returns SRE_Match objects """
-    pos_func_comments = re.compile('{}{}'.format(COMMENT.pattern,
-                                                 WHITESPACE.pattern))
-    pos_funcs = [a  for a in re.finditer(FUNCTION_START, line)]
-    pos_comms = [a for a in re.finditer(pos_func_comments, line)]
+        Returns Spans """
+    if tokens is None:
+        tokens = tokenize(line)
+    if headers is None:
+        headers = function_headers(tokens)
+    pos_funcs = list()
+    for ftype, fname, brace in headers:
+        pos_funcs.append(Span(line, ftype.start, brace.end))
+    pos_comms = list()
+    for comment in tokens:
+        if comment.kind != 'comment':
+            continue
+        a, b = comment.span()
+        if b < len(line) and line[b].isspace():
+            b += 1
+        pos_comms.append(Span(line, a, b))
+    pos_comms = SpanIndex(pos_comms)
     for i in range(len(pos_funcs)):
         pos_funcs[i] = glue_backward(pos_funcs[i], pos_comms)
     return pos_funcs
 
+@counted
 def glue_forward(first, second_list):
     """ Given a first SRE match, find an SRE match in the second list which
-        starts where the first ends.  If found, return (group, span), else
-        return the (group, span) for the first. """
-    i = first.span()[1]
-    for s in second_list:
-        if s.span()[0] == i:
-            return Custom_SRE_Match(first.group() + s.group(),
-                   (first.span()[0], s.span()[1]))
-    return Custom_SRE_Match(first.group(), first.span())
-
+        starts where the first ends.  If found, return the match spanning
+        both, else return first.  second_list may be a SpanIndex, which
+        makes the search a single lookup. """
+    if not isinstance(second_list, SpanIndex):
+        second_list = SpanIndex(second_list)
+    s = second_list.starts.get(first.span()[1])
+    if s is not None:
+        return join_spans(first, s)
+    return first
+
+@counted
 def glue_backward(second, first_list):
     """ Given a second SRE match, find an SRE match in first_list which
-        ends where the second starts.  If found, return (group, span), else
-        return the (group, span) for the second."""
-    i = second.span()[0]
-    for f in first_list:
-        if f.span()[1] == i:
-            return Custom_SRE_Match(f.group() + second.group(),
-                    (f.span()[0], second.span()[1]))
-    return Custom_SRE_Match(second.group(), second.span())
+        ends where the second starts.  If found, return the match spanning
+        both, else return second.  first_list may be a SpanIndex, which
+        makes the search a single lookup. """
+    if not isinstance(first_list, SpanIndex):
+        first_list = SpanIndex(first_list)
+    f = first_list.ends.get(second.span()[0])
+    if f is not None:
+        return join_spans(f, second)
+    return second
+
+@counted
+def function_headers(tokens):
+    """ Return a list of (type, name, open brace) Token triples, one for
+        each function definition (`type name(...) {`) in tokens. """
+    code = [t for t in tokens if t.kind != 'newline']
+    ret = list()
+    i = 0
+    while i < len(code) - 3:
+        if (code[i].kind != 'identifier'
+                or code[i+1].kind != 'identifier'
+                or code[i+2].kind != 'open_paren'
+                or code[i+1].group() in KEYWORDS):
+            i += 1
+            continue
+        j = i + 3
+        while j < len(code) and code[j].kind not in PARAMETER_STOP:
+            j += 1
+        if (j + 1 < len(code) and code[j].kind == 'close_paren'
+                and code[j+1].kind == 'open_brace'):
+            ret.append((code[i], code[i+1], code[j+1]))
+            j += 1
+        # No header can start between i and j, so skip straight to j.
+        i = j
+    return ret
+
+@counted
+def indentation_levels(tokens):
+    """ Return a list of (start, token, level, continued) tuples, one for
+        each line which holds code or a comment: the offset of the start
+        of the line, its first Token, the number of levels it should be
+        indented, and whether it continues a statement begun on an earlier
+        line (and so may be indented further).  A level is added for each
+        open brace, and for the single statement body of an if, for,
+        while, else or do without braces.  The case and default labels of
+        a switch are at the level of its braces, and the statements after
+        them one level further.  Preprocessor lines are left out.  This is
+        a single pass over tokens. """
+    ret = list()
+    depth = parens = pending = 0
+    controls = list()
+    # The depth inside the braces of each switch the token is in.
+    switches = list()
+    prev = None
+    body = opens_switch = label = after_label = False
+    start = 0
+    first = True
+    directive = False
+    for t in tokens:
+        kind = t.kind
+        if kind == 'newline':
+            start = t.span()[1]
+            first = True
+            directive = False
+            continue
+        if first:
+            first = False
+            if kind == 'other' and t.group() == '#':
+                directive = True
+                continue
+            if body and kind != 'open_brace':
+                pending += 1
+            level = max(0, depth + pending - (kind == 'close_brace'))
+            if (switches and depth == switches[-1] and kind != 'close_brace'
+                    and t.group() not in LABEL_KEYWORDS):
+                level += 1
+            continued = parens > 0 or (prev is not None and not body
+                                       and not after_label
+                                       and prev.kind not in STATEMENT_END)
+            body = False
+            ret.append((start, t, level, continued))
+        if directive or kind in COMMENT_KINDS:
+            continue
+        ends_header = ends_switch = ends_label = False
+        if kind == 'open_brace':
+            depth += 1
+            pending = 0
+            if opens_switch:
+                switches.append(depth)
+        elif kind == 'close_brace':
+            if switches and depth == switches[-1]:
+                switches.pop()
+            depth = max(0, depth - 1)
+            pending = 0
+        elif kind == 'open_paren':
+            parens += 1
+            if (prev is not None and prev.kind == 'identifier'
+                    and prev.group() in CONTROL_KEYWORDS):
+                controls.append((parens, prev.group()))
+        elif kind == 'close_paren':
+            if controls and controls[-1][0] == parens:
+                ends_switch = controls.pop()[1] == 'switch'
+                ends_header = True
+            parens = max(0, parens - 1)
+        elif kind == 'semicolon' and parens == 0:
+            pending = 0
+        elif kind == 'identifier' and t.group() in ('else', 'do'):
+            ends_header = True
+        elif kind == 'identifier' and t.group() in LABEL_KEYWORDS:
+            label = True
+        elif kind == 'other' and label and t.group() == ':':
+            # The colon of a label ends it like a statement.
+            label = False
+            ends_label = True
+        body = ends_header
+        opens_switch = ends_switch
+        after_label = ends_label
+        prev = t
+    return ret
+
+
+def declared_names(statement):
+    """ Return the name Tokens declared by statement, a list of Tokens
+        without newlines or comments, or an empty list if it does not
+        declare variables (`type [*]name [= value], [*]name ...`). """
+    if (len(statement) < 2 or statement[0].kind != 'identifier'
+            or statement[0].group() in KEYWORDS):
+        return []
+    parts = [[]]
+    depth = 0
+    for t in statement:
+        if t.kind == 'open_paren' or t.group() == '[':
+            depth += 1
+        elif t.kind == 'close_paren' or t.group() == ']':
+            depth -= 1
+        elif depth == 0 and t.group() == ',':
+            parts.append([])
+            continue
+        parts[-1].append(t)
+    names = list()
+    for i, part in enumerate(parts):
+        declarator = list()
+        for t in part:
+            if t.group() in ('=', '['):
+                break
+            declarator.append(t)
+        identifiers = [t for t in declarator if t.kind == 'identifier']
+        if (not declarator or declarator[-1].kind != 'identifier'
+                or len(identifiers) < (2 if i == 0 else 1)
+                or any(t.kind != 'identifier' and t.group() != '*'
+                       for t in declarator)):
+            return []
+        names.append(declarator[-1])
+    return names
+
+
+@counted
+def variable_declarations(tokens, headers):
+    """ Return a list of (block, name) pairs, one for each variable
+        declared within a function: the offset of the open brace of the
+        block it is declared in, and the Token of its name.  This is a
+        single pass over tokens; headers are the function headers of
+        tokens. """
+    bodies = set(brace.span()[0] for _, _, brace in headers)
+    ret = list()
+    blocks = list()
+    statement = list()
+    parens = 0
+    for t in tokens:
+        kind = t.kind
+        if kind == 'newline' or kind in COMMENT_KINDS:
+            continue
+        if kind == 'open_paren':
+            parens += 1
+        elif kind == 'close_paren':
+            parens = max(0, parens - 1)
+        if kind not in STATEMENT_END or (kind == 'semicolon' and parens):
+            statement.append(t)
+            continue
+        if kind == 'semicolon' and blocks and blocks[-1] is not None:
+            ret.extend((blocks[-1], name)
+                       for name in declared_names(statement))
+        elif kind == 'open_brace':
+            start = t.span()[0]
+            inside = start in bodies or (bool(blocks)
+                                         and blocks[-1] is not None)
+            blocks.append(start if inside else None)
+        elif kind == 'close_brace' and blocks:
+            blocks.pop()
+        statement = list()
+        parens = 0
+    return ret
+
+
+@counted
+def macro_definitions(tokens):
+    """ Return the name Token of each object-like macro, defined by
+        `#define NAME value`, in tokens. """
+    ret = list()
+    first = True
+    for i, t in enumerate(tokens):
+        if t.kind == 'newline':
+            first = True
+            continue
+        if (first and t.group() == '#' and i + 2 < len(tokens)
+                and tokens[i+1].group() == 'define'
+                and tokens[i+2].kind == 'identifier'):
+            name = tokens[i+2]
+            after = tokens[i+3] if i + 3 < len(tokens) else None
+            if (after is None or after.kind != 'open_paren'
+                    or after.span()[0] != name.span()[1]):
+                ret.append(name)
+        first = False
+    return ret
 
 def find_function_start(line):
     """ Find the first start of a function. (Not a function prototype.) """
-    fs_gen = re.finditer(FUNCTION_START, line)
+    fs_gen = FUNCTION_START.finditer(line)
     for function_start in fs_gen:
         return function_start.span()[0], function_start.span()[1]
     return None
 
 
-def parse_block(line, start):
+@counted
+def parse_block(line, start, braces=None):
     """ Parse a block in line starting at index i. Return the indices of
-        said block.  """
+        said block.  If given, braces is the BraceTable of line. """
+    if braces is None:
+        braces = BraceTable(line)
+    end = braces.ends.get(start)
+    if end is not None:
+        return (start, end)
+    # start is not a brace the tokenizer saw (it may be inside a comment),
+    # so fall back to counting characters.
     i = start + 1
     count = 1
     while count > 0 and i < len(line):
@@ -117,23 +763,39 @@ def parse_block(line, start):
         i += 1
     return (start, i)
 
-def parse_functions_with_bodies(line):
-    """ Return a generator which parses functions (with comments) from
-    code. Returns as a tuple: (function, start index, end index)."""
-    for possf in find_function_or_comment(line):
+@counted
+def parse_functions(line, tokens=None, braces=None, headers=None):
+    """ Return a list of (function, name, block) tuples, where function is
+        a Span of the function (with its comment), name is the
+        function's name and block is the span of its body.  The tokens,
+        BraceTable and function_headers of line may be given if they are
+        already known. """
+    if tokens is None:
+        tokens = tokenize(line)
+    if braces is None:
+        braces = BraceTable(line, tokens)
+    if headers is None:
+        headers = function_headers(tokens)
+    ret = list()
+    for possf, (_, fname, brace) in zip(
+            find_function_or_comment(line, tokens, headers), headers):
         start = possf.span()[0]
+        block = parse_block(line, brace.span()[0], braces)
+        ret.append((Span(line, start, block[1]), fname.group(), block))
+    return ret
 
-        fs = find_function_start(line[start:])
-        if fs is None:
-            continue
-
-        end = parse_block(line, start+fs[1])[1]
-        yield Custom_SRE_Match(line[start:end], (start, end))
+@counted
+def parse_functions_with_bodies(line, tokens=None):
+    """ Return a generator which parses functions (with comments) from
+    code. Returns Spans of each function."""
+    for function, _, _ in parse_functions(line, tokens):
+        yield function
 
+@counted
 def parse_variable_declarations(line):
     """ Return a list of variable declarations from the input.
         Doesn't check if the variable declaration is a parameter. """
-    return re.findall(VARIABLE_DECLARATION, line)
+    return VARIABLE_DECLARATION.findall(line)
 
 def remove_given_ranges(line, ranges):
     """ Remove the given ranges from the line. """
@@ -146,53 +808,29 @@ def remove_given_ranges(line, ranges):
     ret += line[start_cpy:]
     return ret
 
+@counted
 def replace_given_ranges(line, ranges):
     """ Replaces the given ranges with spaces. """
-    ret = str(line)
-    for r in ranges:
-        a = r[0]
-        b = r[1] if r[1] < len(line) else len(line)-1
-        ret = ret[:a] + ' '*(b-a+1) + ret[b+1:]
-    return ret
+    return Mask(line, ranges).text()
 
+@counted
 def parse_structs(line):
     """ Return a tuple contaiting the SRE match objects of structs. """
-    ret = [a for a in re.finditer(DEFINE_STRUCT, line)]
-    l2 = replace_given_ranges(line, [a.span() for a in ret])
-    ret += [a for a in re.finditer(STRUCT, l2)]
+    ret = [a for a in DEFINE_STRUCT.finditer(line)]
+    mask = Mask(line, [a.span() for a in ret])
+    ret += [a for a in mask.finditer(STRUCT)]
     return ret
 
-def complete_blocks(line, l):
-    """ Given a list of Custome_SRE_Match (with a '{' at the end of their
-        groups, return the list with items extended to include their entire
-        blocks.) """
-    ret = list()
-    for i in l:
-        a = i.span()[0]
-        b = parse_block(line, i.span()[1]-1)[1]
-        spaces_after = re.match(re.compile('\s?'), line[b+1:])
-        if spaces_after:
-            b += spaces_after.span()[1]+1
-        ret.append(Custom_SRE_Match(line[a:b], (a, b)))
-    return ret
-
-def parse_ifs(line):
-    """ Return a tuple containing Custom_SRE_Match objects of ifs. """
-    ei = [a for a in re.finditer(ELSE_IF_WITH_CURL, line)]
-    ei = complete_blocks(line, ei)
-    ei += [a for a in re.finditer(ELSE_IF_SANS_CURL, line)]
-    l2 = replace_given_ranges(line, [a.span() for a in ei])
-    i = [a for a in re.finditer(IF_WITH_CURL, l2)]
-    i = complete_blocks(l2, i)
-    i += [a for a in re.finditer(IF_SANS_CURL, l2)]
-    e = [a for a in re.finditer(ELSE_WITH_CURL, l2)]
-    e = complete_blocks(l2, e)
-    e += [a for a in re.finditer(ELSE_SANS_CURL, l2)]
-    for a in range(len(i)):
-        i[a] = glue_forward(i[a], ei)
-    for a in range(len(i)):
-        i[a] = glue_forward(i[a], e)
-    return i
+@counted
+def parse_ifs(line, tree=None):
+    """ Return a list of the Blocks of if statements, each with its chain
+        of else ifs and else.  The ifs of else ifs are not listed on their
+        own.  If given, tree is the block tree of line. """
+    if tree is None:
+        tree = block_tree(line)
+    chained = set(id(e.children[0]) for e in tree.walk('else')
+                  if e.children and e.children[0].start == e.body)
+    return [i for i in tree.walk('if') if id(i) not in chained]
 
 def function_name_from_body(line):
     """ Given a function declaration, give the name of the function. """
@@ -200,39 +838,162 @@ def function_name_from_body(line):
     return re.findall(func_regex, line)[0]
 
 
-def parse_function_blocks(line):
+@counted
+def parse_function_blocks(line, tokens=None):
     """ Return all function blocks in line. """
-    funcs = parse_functions_with_bodies(line)
-    ret = []
-    for func in funcs:
-        i = line.find('{', func.span()[0], func.span()[1])
-        ret.append(parse_block(line, i))
-    return ret
+    return [block for _, _, block in parse_functions(line, tokens)]
 
-def parse_function_block(line, span):
-    """ Return the block in the given span. """
+@counted
+def parse_function_block(line, span, braces=None):
+    """ Return the block in the given span. If given, braces is the
+        BraceTable of line. """
     i = line.find('{', span[0], span[1])
-    return parse_block(line, i)
+    return parse_block(line, i, braces)
 
-def find_all_comments(line, span=None):
+@counted
+def find_all_comments(line, span=None, tokens=None):
     """ Find all block and inline comments in the span. """
     if span is None:
         span = (0, len(line))
+    if tokens is None:
+        tokens = tokenize(line)
     ret = list()
-    bc_gen = re.finditer(COMMENT, line[span[0]:span[1]])
-    ic_gen = re.finditer(INLINE_COMMENT, line[span[0]:span[1]])
-    for block_comment in bc_gen:
-        rmin, rmax = block_comment.span()
-        rmin += span[0]
-        rmax += span[0]
-        ret.append((rmin, rmax))
-    for inline_comment in ic_gen:
-        rmin, rmax = inline_comment.span()
-        rmin += span[0]
-        rmax += span[0]
-        ret.append((rmin, rmax))
-    ret.sort()
+    for t in tokens:
+        if t.kind not in ('comment', 'inline_comment'):
+            continue
+        if t.span()[0] >= span[0] and t.span()[1] <= span[1]:
+            ret.append(t.span())
     return ret
 
-def parse_fors(line):
-    pass
+@counted
+def block_tree(line, tokens=None, braces=None, functions=None):
+    """ Return the Block of kind 'program' at the root of the block tree
+        of line, built in a single pass over its tokens.  The tokens,
+        BraceTable and parse_functions of line may be given if they are
+        already known. """
+    if tokens is None:
+        tokens = tokenize(line)
+    if braces is None:
+        braces = BraceTable(line, tokens)
+    if functions is None:
+        functions = parse_functions(line, tokens, braces)
+    code = [t for t in tokens
+            if t.kind != 'newline' and t.kind not in COMMENT_KINDS]
+    bodies = dict((block[0], (func, name)) for func, name, block in functions)
+    # The index of the close paren of each open paren, if they are not
+    # split by a brace.
+    closing = dict()
+    opened = list()
+    for i, t in enumerate(code):
+        if t.kind == 'open_paren':
+            opened.append(i)
+        elif t.kind == 'close_paren' and opened:
+            closing[opened.pop()] = i
+        elif t.kind in ('open_brace', 'close_brace'):
+            opened = list()
+
+    root = Block('program', line, 0, len(line))
+    # Each open Block is kept with the offset at which its block body ends;
+    # None if its body is a single statement; or 'while' for a do waiting
+    # for its condition.
+    stack = [[root, len(line)]]
+    skip = 0
+
+    def open_body(node, j):
+        """ Open node, whose body starts at code[j].  Return the index of
+            the next token to read. """
+        stack[-1][0].children.append(node)
+        if j >= len(code):
+            node.end = code[-1].end
+            return j
+        node.body = code[j].start
+        if code[j].kind == 'open_brace' and code[j].start not in bodies:
+            stack.append([node, braces.ends[code[j].start]])
+            return j + 1
+        stack.append([node, None])
+        return j
+
+    def finish(node, i):
+        """ Close the statements which end with code[i], from node (which
+            has just been closed) out, up to an else or the while of a
+            do. """
+        follows = code[i+1].group() if i + 1 < len(code) else None
+        while True:
+            if node is not None and node.kind == 'if' and follows == 'else':
+                stack.append([node, None])
+                return
+            if node is not None and node.kind == 'do' and follows == 'while':
+                stack.append([node, 'while'])
+                return
+            if stack[-1][1] is not None:
+                return
+            node = stack.pop()[0]
+            node.end = code[i].end
+
+    # Only braces, semicolons and the keywords of blocks change the tree,
+    # so the other tokens are never looked at on their own.
+    marks = [i for i, t in enumerate(code) if t.kind in BLOCK_TOKENS
+             or (t.kind == 'identifier' and t.group() in BLOCK_KEYWORDS)]
+    for i in marks:
+        if i < skip:
+            continue
+        t = code[i]
+        skip = i + 1
+        if t.kind == 'identifier':
+            word = t.group()
+            if word == 'while' and stack[-1][1] == 'while':
+                stack[-1][1] = None
+                skip = closing.get(i + 1, i) + 1
+            elif word in CONTROL_KEYWORDS:
+                if i + 1 in closing:
+                    skip = open_body(Block(word, line, t.start),
+                                     closing[i+1] + 1)
+            elif word in ('else', 'do'):
+                skip = open_body(Block(word, line, t.start), i + 1)
+            elif word == 'struct' and i + 1 < len(code):
+                j = i + 1
+                name = None
+                if code[j].kind == 'identifier':
+                    name = code[j].group()
+                    j += 1
+                if (j < len(code) and code[j].kind == 'open_brace'
+                        and code[j].start not in bodies):
+                    node = Block('struct', line, t.start, name=name,
+                                 body=code[j].start)
+                    stack[-1][0].children.append(node)
+                    stack.append([node, braces.ends[code[j].start]])
+                    skip = j + 1
+        elif t.kind == 'open_brace':
+            if t.start in bodies:
+                func, name = bodies[t.start]
+                node = Block('function', line, func.start, name=name,
+                             body=t.start)
+            else:
+                node = Block('block', line, t.start, body=t.start)
+            stack[-1][0].children.append(node)
+            stack.append([node, braces.ends[t.start]])
+        elif t.kind == 'close_brace':
+            # A statement left open in the block ends with it.
+            while not isinstance(stack[-1][1], int):
+                stack.pop()[0].end = code[i-1].end
+            if len(stack) > 1 and stack[-1][1] == t.end:
+                node = stack.pop()[0]
+                node.end = t.end
+                if node.kind not in ('struct', 'block'):
+                    finish(node, i)
+        elif t.kind == 'semicolon' and stack[-1][1] is None:
+            finish(None, i)
+    while len(stack) > 1:
+        node, end = stack.pop()
+        node.end = end if isinstance(end, int) else code[-1].end
+    return root
+
+@counted
+def parse_fors(line, tokens=None, braces=None, tree=None):
+    """ Return a list of the Blocks of for loops, from the keyword through
+        the end of the body, which is either a block or a single
+        statement.  If given, tokens, braces and tree are those of
+        line. """
+    if tree is None:
+        tree = block_tree(line, tokens, braces)
+    return list(tree.walk('for'))
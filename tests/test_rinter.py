@@ -1,8 +1,41 @@
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
 import unittest
 from random import choice
 
+import rinter
+
 from rinter.rinter import *
 from rinter.rinter_utilities import *
+from rinter.rinter_archive import *
+from rinter.rinter_batch import *
+from rinter.rinter_cache import *
+from rinter.rinter_chunk import *
+from rinter.rinter_fix import *
+from rinter.rinter_git import *
+from rinter.rinter_incremental import *
+from rinter.rinter_include import *
+from rinter.rinter_profile import *
+from rinter.rinter_server import *
+
+IMPORT_BUDGET = 0.25
+IMPORT_SCRIPT = """
+import time
+start = time.perf_counter()
+import rinter.rinter
+elapsed = time.perf_counter() - start
+from rinter.rinter_utilities import LazyPattern
+print(elapsed)
+print(','.join(name for name, value in vars(rinter.rinter).items()
+               if isinstance(value, LazyPattern) and value._compiled))
+"""
+
 
 class TestUtilityMethods(unittest.TestCase):
 
@@ -21,6 +54,25 @@ class TestUtilityMethods(unittest.TestCase):
         self.assertEqual(b1, (0, len(self.block)))
         self.assertEqual(b2, (10, len(self.block)+10))
 
+    def test_brace_table(self):
+        braces = BraceTable(self.embedded_block)
+        self.assertEqual(braces.ends[10], len(self.block)+10)
+        self.assertEqual(braces.unmatched, [])
+        unbalanced = '}\n{ "}" {}\n'
+        braces = BraceTable(unbalanced)
+        self.assertEqual(braces.unmatched, [0, 2])
+        self.assertEqual(braces.ends[2], len(unbalanced))
+        self.assertEqual(parse_block(unbalanced, 2), (2, len(unbalanced)))
+
+    def test_line_index(self):
+        lines = LineIndex(self.embedded_block)
+        self.assertEqual(lines.location(0), (1, 1))
+        self.assertEqual(lines.location(6), (2, 1))
+        self.assertEqual(lines.location(10), (2, 5))
+        self.assertEqual(list(lines.lines())[:2], [(0, 5), (6, 11)])
+        self.assertEqual(lines.format(10, 'brace'), '2:5: brace')
+        self.assertTrue(location_key('10:1: b') > location_key('9:20: a'))
+
     def test_find_function_or_comment_not_prototype(self):
         p1 = find_function_or_comment(self.c)
         p2 = find_function_or_comment(self.c_and_f)
@@ -37,6 +89,55 @@ class TestUtilityMethods(unittest.TestCase):
         p1 = find_function_or_comment(f)
         self.assertEqual(len(p1), 2)
 
+    def test_import_time(self):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.path.dirname(os.path.dirname(rinter.__file__))
+        out = subprocess.check_output([sys.executable, '-c', IMPORT_SCRIPT],
+                                      env=env, universal_newlines=True)
+        elapsed, compiled = out.split('\n')[:2]
+        self.assertEqual(compiled, '')
+        self.assertTrue(float(elapsed) < IMPORT_BUDGET, elapsed)
+
+    def test_tokenize(self):
+        tokens = tokenize('int a = "{/*";\n/* c */ b(\'}\'); // x')
+        kinds = [t.kind for t in tokens]
+        self.assertEqual(kinds, ['identifier', 'identifier', 'other',
+                                 'string', 'semicolon', 'newline', 'comment',
+                                 'identifier', 'open_paren', 'char',
+                                 'close_paren', 'semicolon',
+                                 'inline_comment'])
+        self.assertEqual(tokens[3].group(), '"{/*"')
+
+    def test_braces_in_strings_ignored(self):
+        f = 'int func(void) {\nputs("}");\nputs("/*");\n}\n'
+        functions = [a for a in parse_functions_with_bodies(f)]
+        self.assertEqual(len(functions), 1)
+        self.assertEqual(functions[0].span(), (0, len(f)-1))
+        self.assertEqual(comments_within_functions(f), [])
+
+    def test_glue_with_span_index(self):
+        l = 'aaabbbccc'
+        a = Custom_SRE_Match('aaa', (0, 3))
+        b = Custom_SRE_Match('bbb', (3, 6))
+        c = Custom_SRE_Match('ccc', (6, 9))
+        index = SpanIndex([a, c])
+        self.assertEqual(glue_forward(b, index).span(), (3, 9))
+        self.assertEqual(glue_backward(b, index).group(), 'aaabbb')
+        self.assertEqual(glue_forward(c, index).span(), (6, 9))
+        self.assertEqual(glue_forward(a, [b]).group(), 'aaabbb')
+
+    def test_spans(self):
+        l = 'aaabbbccc'
+        a, b, c = Span(l, 0, 3), Span(l, 3, 6), Span(l, 6, 9)
+        glued = glue_backward(glue_forward(b, [c]), [a])
+        self.assertTrue(isinstance(glued, Span))
+        self.assertTrue(glued.source is l)
+        self.assertEqual((glued.span(), glued.group()), ((0, 9), l))
+        self.assertTrue(glue_forward(c, [a]) is c)
+        token = tokenize('int a;')[1]
+        self.assertEqual((token.kind, token.group()), ('identifier', 'a'))
+        self.assertFalse(hasattr(token, '__dict__'))
+
     def test_find_function_starts(self):
         p1 = find_function_start(self.c)
         p2 = find_function_start(self.c_and_f)
@@ -56,6 +157,14 @@ class TestUtilityMethods(unittest.TestCase):
         functions2 = [a for a in parse_functions_with_bodies(line2)]
         self.assertEqual(len(functions2), 3)
 
+    def test_load_file(self):
+        with open('test_good_program.c', 'r') as fin:
+            text = fin.read()
+        self.assertEqual(load_file('test_good_program.c'), text)
+        self.assertEqual(decode_program(b'a\r\nb\rc\n'), 'a\nb\nc\n')
+        with tempfile.NamedTemporaryFile(suffix='.c') as f:
+            self.assertEqual(load_file(f.name), '')
+
     def test_parse_variable_declarations(self):
         vs = ['int i;', 'int i = 4;', 'int i, j = 6;',
              'int * j = &i;', 'char a = b + c / 8;',
@@ -92,6 +201,15 @@ class TestUtilityMethods(unittest.TestCase):
         self.assertTrue(l2[5:10].isspace())
         self.assertTrue('b' not in l2)
 
+    def test_mask(self):
+        l = 'a'*5 + 'b'*5 + 'c'*5 + 'd'*5
+        mask = Mask(l, [(15, 30), (3, 6)])
+        mask.exclude([(5, 7)])
+        self.assertEqual(mask.text(), 'aaa' + ' '*5 + 'bb' + 'c'*5 + ' '*5)
+        self.assertEqual([m.span() for m in mask.finditer('c+')], [(10, 15)])
+        self.assertEqual(mask.text(), replace_given_ranges(
+            l, [(15, 30), (3, 6), (5, 7)]))
+
     def test_parse_structs(self):
         structfile = load_file('test_structs.c')
         structs = parse_structs(structfile)
@@ -106,7 +224,32 @@ class TestUtilityMethods(unittest.TestCase):
         self.assertTrue('else if' in ifs[0].group())
 
     def test_parse_fors(self):
-        pass
+        program = ('for (i = 0; i < n; i++) {\n   a();\n}\n'
+                   'for (;;)\n   for (j = f(0); j; j--)\n      b(j);\n')
+        fors = parse_fors(program)
+        self.assertEqual(len(fors), 3)
+        self.assertTrue(fors[0].group().endswith('}'))
+        self.assertTrue(fors[1].group().endswith('b(j);'))
+        self.assertEqual(fors[1].span()[1], fors[2].span()[1])
+
+    def test_block_tree(self):
+        tree = block_tree(load_file('test_ifs.c'))
+        self.assertEqual([b.kind for b in tree.children],
+                         ['if', 'if', 'while', 'if'])
+        chain = tree.children[0]
+        self.assertEqual([b.kind for b in chain.walk()],
+                         ['else', 'if', 'else'])
+        self.assertEqual(chain.end, list(chain.walk())[-1].end)
+        self.assertTrue(chain.group().endswith('do_something(c);\n}'))
+        tree = block_tree('do\n   a();\nwhile (b);\n'
+                          'struct s {\n   int c;\n};\n')
+        do, struct = tree.children
+        self.assertEqual(do.group(), 'do\n   a();\nwhile (b);')
+        self.assertEqual((struct.kind, struct.name), ('struct', 's'))
+        program = load_file('test_good_program.c')
+        functions = list(block_tree(program).walk('function'))
+        self.assertEqual([f.name for f in functions],
+                         [name for _, name, _ in parse_functions(program)])
 
 
 class TestDocumentationMethods(unittest.TestCase):
@@ -146,19 +289,67 @@ class TestDocumentationMethods(unittest.TestCase):
         self.assertTrue(no_global_functions(self.good_program) is None)
         self.assertEqual(len(no_global_functions(self.bad_program)), 3)
 
+    def test_prototypes_in_comments_and_strings(self):
+        program = ('/* Call void greet(char *n); first. */\n'
+                   '// int old(void);\n'
+                   'char *s = "int bad(void);";\n'
+                   "char c = 'x'; int f(int a);\n")
+        self.assertEqual(no_global_functions(program),
+                         ['4:15: Global function prototype'])
+        # Words either side of a function do not make a prototype.
+        program = '#define N 100\nint f(void)\n{\n}\nputs(s);\n'
+        self.assertEqual(no_global_functions(program), [])
+
 
     def test_two_lines_before_functions(self):
         self.assertTrue(two_lines_before_functions(self.good_program) is None)
         self.assertEqual(len(two_lines_before_functions(self.bad_program)), 3)
 
     def test_indentation_level_three_spaces(self):
-        self.assertTrue(indentation_level_three_spaces(self.good_program)
-            is None)
+        self.assertEqual(indentation_level_three_spaces(self.good_program),
+            [])
         self.assertEqual(len(indentation_level_three_spaces(self.bad_program)),
             9)
 
+    def test_indentation_in_switch(self):
+        program = ('int f(int a)\n{\n   switch (a) {\n      case 1:\n'
+                   '         a = 2;\n         break;\n      default: {\n'
+                   '         a = 3;\n      }\n   }\n   switch (a) {\n'
+                   '      case 1:\n            a = 2;\n'
+                   '            break;\n   }\n}\n')
+        self.assertEqual(indentation_level_three_spaces(program),
+                         ['13:13: Line indented 12 spaces, expected 9',
+                          '14:13: Line indented 12 spaces, expected 9'])
+
+    def test_parse_lines(self):
+        parsed = parse_lines(self.good_program)
+        self.assertEqual(parsed.facts, {})
+        self.assertEqual(len(parsed['functions']), 3)
+        self.assertTrue(parsed.has('tokens'))
+        self.assertFalse(parsed.has('prototypes'))
+        self.assertTrue(parsed.tokens is parsed['tokens'])
+
+    def test_error_list_rules(self):
+        errors = error_list(self.bad_program, ['all_lines_eighty_characters'])
+        self.assertEqual(errors, all_lines_eighty_characters(self.bad_program))
+        rules = select_rules(ignore=['file_header'])
+        self.assertFalse('file_header' in rules)
+        self.assertEqual(len(rules), len(RULES) - 1)
+        self.assertRaises(ValueError, select_rules, ['no_such_rule'])
+
+    def test_iter_errors(self):
+        with profiling(Profiler()) as profiler:
+            first = next(iter_errors(self.bad_program))
+        self.assertEqual(first, error_list(self.bad_program)[0])
+        self.assertEqual(list(profiler.checks), ['header', 'functions',
+                                                 'lines', 'file_header'])
+
     #### FUNCTION TESTS #######################################################
 
+    def test_balanced_braces(self):
+        self.assertEqual(balanced_braces(self.good_program), [])
+        self.assertEqual(len(balanced_braces('int f() {\n{\n}\n')), 1)
+
     def test_comment_before_function(self):
         good = comment_before_function(self.good_program)
         bad = comment_before_function(self.bad_program)
@@ -176,7 +367,499 @@ class TestDocumentationMethods(unittest.TestCase):
         pass
 
     def test_variable_declaration_alphabetical(self):
-        pass
+        self.assertEqual(variables_declared_alphabetically(self.good_program),
+                         [])
+        program = 'int f()\n{\n   int b, a;\n   {\n      int c;\n   }\n}\n'
+        errors = variables_declared_alphabetically(program)
+        self.assertEqual(errors, ['3:11: Variable a not declared in '
+                                  'alphabetical order'])
+
+    def test_mixed_case(self):
+        program = ('#define Max 3\n#define MIN 1\n#define f(x) x\n'
+                   'int f()\n{\n   int someValue, other_value;\n}\n')
+        self.assertEqual(no_mixed_case_variables(program),
+                         ['6:8: Variable someValue mixes upper and lower case'])
+        self.assertEqual(constants_upper_case(program),
+                         ['1:9: Constant Max not all upper case'])
+        self.assertEqual(no_mixed_case_variables(self.good_program), [])
+        self.assertEqual(constants_upper_case(self.good_program), [])
+
+class TestBatchMethods(unittest.TestCase):
+
+    def test_expand_paths(self):
+        files = expand_paths(['.', 'test_*.c', 'missing.c'])
+        self.assertEqual(files.count('./test_good_program.c'), 1)
+        self.assertTrue('test_good_program.c' in files)
+        self.assertEqual(files[-1], 'missing.c')
+
+    def test_expand_glob_directories(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in ('alice/a.c', 'alice/README', 'bob/sub/b.c',
+                         'notes.txt'):
+                path = os.path.join(tmp, name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                open(path, 'w').close()
+            expected = [os.path.join(tmp, 'alice', 'a.c'),
+                        os.path.join(tmp, 'bob', 'sub', 'b.c')]
+            self.assertEqual(expand_paths([os.path.join(tmp, '*')]),
+                             expected)
+            self.assertEqual(expand_paths([os.path.join(tmp, '**')]),
+                             expected)
+
+    def test_lint_files(self):
+        files = ['test_bad_program.c', 'missing.c', 'test_good_program.c']
+        results = list(lint_files(files, jobs=2))
+        self.assertEqual([r[0] for r in results], files)
+        self.assertEqual(results[0][1], sorted(error_list(
+            load_file('test_bad_program.c')), key=location_key))
+        self.assertTrue(results[0][2] is None)
+        self.assertTrue(results[1][2] is not None)
+        self.assertEqual(results[2][1], [])
+
+
+    def test_lint_files_with_programs(self):
+        program = load_file('test_bad_program.c')
+        sources = ['test_good_program.c', ('<memory>', program)]
+        results = list(lint_files(sources, jobs=2))
+        self.assertEqual([r[0] for r in results],
+                         ['test_good_program.c', '<memory>'])
+        self.assertEqual(results[1][1], lint_file('test_bad_program.c')[1])
+
+    def test_lint_file_timeout(self):
+        program = 'int a = b + c - d * e / f % g | h & i\n' * 20000
+        with tempfile.NamedTemporaryFile('w', suffix='.c') as f:
+            f.write(program)
+            f.flush()
+            filename, errors, failure = lint_file(f.name, timeout=0.01)
+        self.assertTrue(failure is None)
+        self.assertEqual(len(errors), 1)
+        self.assertTrue('timed out' in errors[0])
+
+
+    def test_lint_files_profiled(self):
+        files = ['test_bad_program.c', 'test_good_program.c']
+        profiler = Profiler()
+        results = list(lint_files(files, jobs=2, profiler=profiler))
+        self.assertEqual([r[0] for r in results], files)
+        self.assertEqual(profiler.checks['no_global_functions']['calls'], 2)
+        self.assertTrue(profiler.calls['tokenize'] >= 2)
+
+    def test_print_results(self):
+        files = ['test_bad_program.c', 'missing.c', 'test_good_program.c']
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            reported = print_results(lint_files(files, jobs=1), 3, 'jsonl')
+        lines = [json.loads(l) for l in out.getvalue().splitlines()]
+        self.assertEqual(reported, 3)
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[0], {'file': 'test_bad_program.c', 'line': 1,
+                                    'column': 1,
+                                    'message': 'File header missing.'})
+
+
+class TestGit(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.repo = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def commit(self, files):
+        for name, content in files.items():
+            path = os.path.join(self.repo, name)
+            if content is None:
+                os.remove(path)
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(content)
+        git(self.repo, 'add', '-A')
+        git(self.repo, '-c', 'user.name=t', '-c', 'user.email=t@t',
+            'commit', '-qm', 'commit')
+        return git(self.repo, 'rev-parse', 'HEAD').decode().strip()
+
+    def test_changed_programs(self):
+        git(self.repo, 'init', '-q')
+        bad = load_file('test_bad_program.c')
+        base = self.commit({'a.c': 'int a;\n', 'b.c': 'int b;\n',
+                            'c.h': 'int c;\n'})
+        target = self.commit({'a.c': bad, 'b.c': None, 'c.h': 'int d;\n',
+                              'sub/d.c': 'int d;\n'})
+        self.commit({'a.c': 'int e;\n'})
+        self.assertEqual(changed_files(base + '..' + target, self.repo),
+                         ['a.c', 'sub/d.c'])
+        programs = list(changed_programs(base + '..' + target, self.repo))
+        self.assertEqual(programs, [('a.c', bad), ('sub/d.c', 'int d;\n')])
+        self.assertEqual(len(list(changed_programs(base, self.repo))), 2)
+        self.assertRaises(GitError, changed_files, 'nothing..' + target,
+                          self.repo)
+
+    def test_dirty_working_tree(self):
+        git(self.repo, 'init', '-q')
+        base = self.commit({'a.c': 'int a;\n', 'b.c': 'int b;\n'})
+        self.commit({'a.c': 'int c;\n'})
+        with open(os.path.join(self.repo, 'b.c'), 'w') as f:
+            f.write('int d;\n')
+        with open(os.path.join(self.repo, 'new.c'), 'w') as f:
+            f.write('int e;\n')
+        git(self.repo, 'add', 'new.c')
+        self.assertEqual(list(changed_programs(base, self.repo)),
+                         [('a.c', 'int c;\n')])
+        self.assertEqual(changed_files('HEAD', self.repo), [])
+
+
+class TestIncludes(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.write('lib/course.h', '#include "types.h"\nint helper(int a);\n')
+        self.write('lib/types.h', '#define SIZE 3\nstruct point {\n'
+                   '   int x;\n};\nint other(int a);\n')
+        self.program = ('#include "course.h"\n#include "missing.h"\n'
+                        'int helper(int a);\nint other(int a);\n'
+                        'int third(int a);\n')
+        self.path = self.write('a.c', self.program)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_resolve_includes(self):
+        cache = HeaderCache()
+        lib = os.path.join(self.tmp.name, 'lib')
+        headers = resolve_includes(self.program, [self.tmp.name, lib], cache)
+        self.assertEqual([os.path.basename(h.path) for h in headers],
+                         ['course.h', 'types.h'])
+        self.assertEqual(headers[1].prototypes, frozenset(['other']))
+        self.assertEqual(headers[1].structs, frozenset(['point']))
+        self.assertEqual(headers[1].defines, frozenset(['SIZE']))
+        with profiling(Profiler()) as profiler:
+            again = resolve_includes(self.program, [lib], cache)
+        self.assertTrue(again[0] is headers[0])
+        self.assertEqual(profiler.calls['header cache hit'], 2)
+
+    def test_header_structs(self):
+        header = Header('h', '#define struct point {\n   int x;\n} P;\n'
+                        'struct size {\n   int w;\n};\n')
+        self.assertEqual(header.structs, frozenset(['point', 'size']))
+
+    def test_no_global_functions(self):
+        lib = os.path.join(self.tmp.name, 'lib')
+        errors = lint_file(self.path, rules=['no_global_functions'],
+                           include_path=[lib])[1]
+        self.assertEqual(errors, ['5:1: Global function prototype'])
+        errors = lint_file(self.path, rules=['no_global_functions'])[1]
+        self.assertEqual(len(errors), 3)
+
+    def test_cache_key(self):
+        cache = ResultCache(self.tmp.name)
+        lib = os.path.join(self.tmp.name, 'lib')
+        key = cache.key(ParsedProgram(self.program, [lib]))
+        self.assertNotEqual(key, cache.key(self.program))
+        self.write('lib/types.h', 'int other(int a, int b);\n')
+        self.assertNotEqual(key, cache.key(ParsedProgram(self.program, [lib])))
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.program = load_file('test_bad_program.c')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_cached_error_list(self):
+        cache = ResultCache(self.tmp.name)
+        key = cache.key(self.program)
+        self.assertTrue(cache.get(key) is None)
+        errors = cached_error_list(self.program, cache)
+        self.assertEqual(cache.get(key), errors)
+        self.assertEqual(cached_error_list(self.program, cache), errors)
+        self.assertNotEqual(key, cache.key(self.program, list(RULES)[1:]))
+        self.assertNotEqual(key, cache.key(self.program + ' '))
+
+    def test_key_depends_on_rules_source(self):
+        import rinter.rinter_cache
+        cache = ResultCache(self.tmp.name)
+        key = cache.key(self.program)
+        digest = rules_digest()
+        try:
+            rinter.rinter_cache._rules_digest = digest[::-1]
+            self.assertNotEqual(cache.key(self.program), key)
+        finally:
+            rinter.rinter_cache._rules_digest = digest
+        self.assertEqual(cache.key(self.program), key)
+
+    def test_max_errors_in_file_order(self):
+        cache = ResultCache(self.tmp.name)
+        errors = cached_error_list(self.program, cache, max_errors=2)
+        self.assertEqual(errors, sorted(error_list(self.program),
+                                        key=location_key)[:2])
+        self.assertEqual(cache.get(cache.key(self.program)),
+                         error_list(self.program))
+        self.assertEqual(cached_error_list(self.program, cache, max_errors=2),
+                         errors)
+
+    def test_fail_fast(self):
+        cache = ResultCache(self.tmp.name)
+        with profiling(Profiler()) as profiler:
+            errors = cached_error_list(self.program, cache, fail_fast=True)
+        self.assertEqual(errors, error_list(self.program)[:1])
+        self.assertEqual(list(profiler.checks), ['header', 'functions',
+                                                 'lines', 'file_header'])
+        self.assertTrue(cache.get(cache.key(self.program)) is None)
+        good = load_file('test_good_program.c')
+        self.assertEqual(cached_error_list(good, cache, fail_fast=True), [])
+        self.assertEqual(cache.get(cache.key(good)), [])
+
+    def test_eviction(self):
+        cache = ResultCache(self.tmp.name, max_size=100)
+        for i in range(10):
+            cache.put(cache.key(str(i)), ['x' * 20])
+        self.assertTrue(sum(e[1] for e in cache.entries()) <= 100)
+        self.assertEqual(cache.size(), sum(e[1] for e in cache.entries()))
+
+    def test_size_index(self):
+        cache = ResultCache(self.tmp.name)
+        cache.put(cache.key('a'), ['x'])
+        cache.put(cache.key('a'), ['x' * 10])
+        cache.put(cache.key('b'), [])
+        self.assertEqual(cache.size(), sum(e[1] for e in cache.entries()))
+        # Another process only reads the index.
+        other = ResultCache(self.tmp.name)
+        other.entries = None
+        other.put(other.key('c'), ['y'])
+        self.assertEqual(cache.size(), sum(e[1] for e in cache.entries()))
+
+
+class TestIncremental(unittest.TestCase):
+
+    def test_incremental_error_list(self):
+        cache = FunctionCache()
+        program = load_file('test_bad_program.c')
+        expected = sorted(error_list(program), key=location_key)
+        for i in range(2):
+            with profiling(Profiler()) as profiler:
+                errors = incremental_error_list(program, cache=cache)
+            self.assertEqual(sorted(errors, key=location_key), expected)
+        self.assertEqual(profiler.calls['function cache hit'],
+                         len(list(chunk_boundaries(program, 1))) + 1)
+
+    def test_edit_rescans_around_it(self):
+        cache = FunctionCache()
+        program = load_file('test_good_program.c')
+        incremental_error_list(program, cache=cache)
+        edits = [program.replace('   customfunction(', '   x = 1;\n'
+                                 '   customfunction('),
+                 program.replace('int main', '}\nint main'),
+                 program[:len(program)//2], program + 'int f(void)\n{\n}\n']
+        for edited in edits:
+            self.assertEqual(cache.boundaries(edited),
+                             list(chunk_boundaries(edited, 1)))
+            self.assertEqual(
+                sorted(incremental_error_list(edited, cache=cache)),
+                sorted(error_list(edited)))
+
+    def test_edited_function(self):
+        cache = FunctionCache()
+        program = load_file('test_good_program.c')
+        incremental_error_list(program, cache=cache)
+        entries = len(cache.entries)
+        edited = program.replace('   customfunction(',
+                                 '   /* inside */\n   customfunction(')
+        errors = incremental_error_list(edited, cache=cache)
+        self.assertEqual(len(cache.entries), entries + 1)
+        self.assertEqual(sorted(errors, key=location_key),
+                         sorted(error_list(edited), key=location_key))
+        self.assertTrue(any('Comment within function' in e for e in errors))
+
+
+class TestFix(unittest.TestCase):
+
+    def test_apply_edits(self):
+        edits = [(4, 5, 'X'), (0, 0, '<'), (0, 2, 'ab'), (3, 6, 'no')]
+        self.assertEqual(apply_edits('0123456', edits), '<ab2no6')
+
+    def test_fix_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bad.c')
+            with open('test_bad_program.c') as fin, open(path, 'w') as fout:
+                fout.write(fin.read())
+            before = lint_file(path)[1]
+            filename, count, failure = fix_file(path)
+            self.assertEqual((filename, failure), (path, None))
+            after = lint_file(path)[1]
+            self.assertEqual(len(before) - len(after), count)
+            self.assertFalse(any('header' in e or 'two lines' in e
+                                 for e in after))
+            self.assertEqual(fix_file(path), (path, 0, None))
+
+    def test_fix_file_timeout(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bad.c')
+            with open('test_bad_program.c') as fin, open(path, 'w') as fout:
+                fout.write(fin.read())
+            self.assertEqual(fix_file(path, timeout=1e-6),
+                             (path, 0, 'Fixing timed out after 1e-06 seconds'))
+            self.assertEqual(load_file(path), load_file('test_bad_program.c'))
+
+    def test_fix_header_before_function(self):
+        program = 'int f(void)\n{\n   return 1;\n}\n'
+        fixed, count = fix_program(program)
+        self.assertEqual(count, 2)
+        self.assertTrue('*/\n\n\nint f(void)' in fixed)
+
+    def test_fix_long_comments(self):
+        program = ('/* ' + 'word ' * 40 + '*/\nint a; // ' + 'word ' * 20
+                   + '\n')
+        fixed, count = fix_program(program, ['all_lines_eighty_characters'])
+        self.assertEqual(count, 2)
+        self.assertEqual(error_list(fixed, ['all_lines_eighty_characters']),
+                         [])
+        self.assertEqual([w for w in fixed.split() if w != '//'],
+                         [w for w in program.split() if w != '//'])
+
+
+class TestArchives(unittest.TestCase):
+
+    MEMBERS = ['test_good_program.c', 'test_bad_program.c']
+
+    def check_archive(self, path):
+        programs = list(archive_programs(path))
+        self.assertEqual([name for name, _ in programs],
+                         [path + ':src/' + m for m in self.MEMBERS])
+        self.assertEqual([p for _, p in programs],
+                         [load_file(m) for m in self.MEMBERS])
+        results = list(lint_files(programs, jobs=2))
+        for (name, errors, failure), member in zip(results, self.MEMBERS):
+            self.assertEqual(name, path + ':src/' + member)
+            self.assertEqual(lint_file(member)[1:], (errors, failure))
+
+    def test_zip(self):
+        import zipfile
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'submissions.zip')
+            with zipfile.ZipFile(path, 'w') as archive:
+                archive.writestr('README', 'not a program')
+                for member in self.MEMBERS:
+                    archive.write(member, 'src/' + member)
+            self.check_archive(path)
+
+    def test_tar(self):
+        import tarfile
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'submissions.tar.gz')
+            with tarfile.open(path, 'w:gz') as archive:
+                archive.add(os.curdir, 'src', recursive=False)
+                archive.add('test_rinter.py', 'src/test_rinter.py')
+                for member in self.MEMBERS:
+                    archive.add(member, 'src/' + member)
+            self.check_archive(path)
+
+    def test_expand_archives(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            names = ['a.zip', 'b.tar.gz', 'notes.txt', 'sub/c.TGZ']
+            for name in names:
+                path = os.path.join(tmp, name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                open(path, 'w').close()
+            expected = [os.path.join(tmp, name)
+                        for name in ('a.zip', 'b.tar.gz', 'sub/c.TGZ')]
+            self.assertEqual(expand_paths([tmp]), expected)
+            self.assertEqual(expand_paths([os.path.join(tmp, '*')]), expected)
+            self.assertEqual(expand_paths([os.path.join(tmp, '*.zip')]),
+                             expected[:1])
+
+    def test_bad_archive(self):
+        with tempfile.NamedTemporaryFile(suffix='.zip') as f:
+            f.write(b'not an archive')
+            f.flush()
+            self.assertTrue(is_archive(f.name))
+            with self.assertRaises(ArchiveError):
+                list(archive_programs(f.name))
+
+
+class TestChunked(unittest.TestCase):
+
+    def test_split_program(self):
+        program = load_file('test_good_program.c')
+        chunks = list(split_program(program, 1))
+        self.assertTrue(len(chunks) > 1)
+        self.assertEqual(''.join(text for _, _, text in chunks), program)
+        for line, column, text in chunks:
+            lines = parse_lines(program).lines
+            offset = lines.starts[line-1] + column - 1
+            self.assertTrue(program.startswith(text, offset))
+
+    def test_chunked_errors(self):
+        for name in ('test_good_program.c', 'test_bad_program.c'):
+            program = load_file(name)
+            self.assertEqual(
+                sorted(iter_chunked_errors(program, size=1),
+                       key=location_key),
+                sorted(error_list(program), key=location_key))
+
+    def test_lint_file_chunked(self):
+        self.assertEqual(lint_file('test_bad_program.c', chunk_size=1),
+                         lint_file('test_bad_program.c'))
+
+
+class TestLintServer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.address = os.path.join(self.tmp.name, 'rinter.sock')
+        server = LintServer(self.address, jobs=1)
+        self.thread = threading.Thread(target=server.serve_forever)
+        self.thread.start()
+        while not server.running:
+            self.thread.join(0.01)
+
+    def tearDown(self):
+        list(request({'shutdown': True}, self.address))
+        self.thread.join()
+        self.tmp.cleanup()
+
+    def test_request(self):
+        program = load_file('test_bad_program.c')
+        responses = list(request({'cwd': os.getcwd(),
+                                  'paths': ['test_bad_program.c'],
+                                  'programs': [['<memory>', program]]},
+                                 self.address))
+        self.assertEqual([r.get('file') for r in responses],
+                         ['test_bad_program.c', '<memory>', None])
+        self.assertEqual(responses[0]['errors'],
+                         lint_file('test_bad_program.c')[1])
+        self.assertEqual(responses[1]['errors'], responses[0]['errors'])
+
+    def test_bad_request(self):
+        response = next(request({'select': ['nope']}, self.address))
+        self.assertEqual(response, {'error': 'Unknown rule nope'})
+
+    def send_line(self, line):
+        import socket
+        with socket.socket(socket.AF_UNIX) as s:
+            s.connect(self.address)
+            with s.makefile('rw', encoding='utf-8') as f:
+                f.write(line + '\n')
+                f.flush()
+                return json.loads(f.readline())
+
+    def test_malformed_requests(self):
+        for line in ('[1]', '{"paths": '):
+            response = self.send_line(line)
+            self.assertTrue(response['error'].startswith('Bad request'))
+        self.assertTrue(self.thread.is_alive())
+        self.test_request()
+
 
 if __name__=='__main__':
     unittest.main()